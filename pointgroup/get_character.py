@@ -1,17 +1,15 @@
 from .tbmodel import TBModel
-import spglib
 from .sym_op import (
     apply_sym_for_all,
     apply_sym_single,
     apply_for_orb,
     check_symmetry,
-    check_symmetry2
+    check_symmetry2,
 )
 import numpy as np
-from .pglib import tr2o3
 from .schonflies import point_group_map
 from .utils import logger
-from .pglib import find_operation_type
+from .symmetry import get_symmetry_context
 
 class GetCharacter:
     """
@@ -34,7 +32,7 @@ class GetCharacter:
         self.rot = None
         self.rot_o3 = None
         self.trans = None
-        self.Umat = tbmodel.Umat  # site, k, band
+        self.Umat = tbmodel.Umat  # band, k, site
         self.dataset = None
         self.nsymm_ops = 0
         self.pos = self.tbmodel.pos  # nsite, ndim
@@ -42,14 +40,27 @@ class GetCharacter:
         self.site_species = self.tbmodel.site_species
         self.site_nlm = self.tbmodel.site_nlm
         self.use_trace = True
+        self.symprec = 1e-5
+        self.symm_ctx = None
+
+    def get_symmetry_context(self):
+        """
+        構造に対応するSymmetryContextをプロセス共通のキャッシュから取得し、
+        self.symm_ctx・self.datasetに格納する。
+        """
+        cell = self.tbmodel.cell
+        pos = self.tbmodel.pos
+        species = self.tbmodel.site_species
+        self.symm_ctx = get_symmetry_context(cell, pos, species, symprec=self.symprec)
+        if self.dataset is None:
+            self.dataset = self.symm_ctx.dataset
+        return self.symm_ctx
 
     def _gen_space_group(self):
         """
         spglibを用いて空間群（international symbol）を取得し、self.spgに格納する。
         """
-        cell = (self.tbmodel.cell, self.tbmodel.pos, self.tbmodel.site_species)
-        if self.dataset is None:
-            self.dataset = spglib.spglib.get_symmetry_dataset(cell)
+        self.get_symmetry_context()
         self.spg = self.dataset["international"]
         return
 
@@ -57,9 +68,7 @@ class GetCharacter:
         """
         spglibを用いて点群（point group symbol）を取得し、self.pgに格納する。
         """
-        cell = (self.tbmodel.cell, self.tbmodel.pos, self.tbmodel.site_species)
-        if self.dataset is None:
-            self.dataset = spglib.spglib.get_symmetry_dataset(cell)
+        self.get_symmetry_context()
         self.pg = self.dataset["pointgroup"]
         return
 
@@ -68,17 +77,58 @@ class GetCharacter:
         spglibを用いて全対称操作（回転・並進）を取得し、
         O(3)回転行列へ変換してself.rot_o3に格納する。
         """
-        cell = (self.tbmodel.cell, self.tbmodel.pos, np.array(self.site_species))
-        self.symm_ops = spglib.spglib.get_symmetry(cell)
-        self.rot = self.symm_ops["rotations"]
-        self.trans = self.symm_ops["translations"]
-
-        self.rot_o3 = np.zeros_like(self.rot)
-        for i in range(self.rot_o3.shape[0]):
-            R = self.rot[i, :, :]
-            self.rot_o3[i, :, :] = tr2o3(self.tbcell, R)
+        ctx = self.get_symmetry_context()
+        self.symm_ops = ctx.symm_ops
+        self.rot = ctx.rot
+        self.trans = ctx.trans
+        self.rot_o3 = ctx.rot_o3
         return self.rot.shape[0]
 
+    def little_group(self, k, tol=1e-6):
+        """
+        k点の小群を返す。
+
+        Parameters
+        ----------
+        k : array_like
+            分率座標のk点
+        tol : float
+            k点比較の許容誤差
+
+        Returns
+        -------
+        lg : LittleGroup
+            操作インデックス(ops)、点群記号(pg, pg_schonflies)、指標表(char_table)
+        """
+        self._get_symm_ops()
+        return self.symm_ctx.little_group(k, tol=tol)
+
+    def get_little_groups(self, tol=1e-6):
+        """
+        self.tbmodel.kptsの全k点について小群を求める。
+
+        Returns
+        -------
+        little_groups : list of LittleGroup
+        """
+        return [self.little_group(k, tol=tol) for k in self.tbmodel.kpts]
+
+    def get_path_little_groups(self, tol=1e-6):
+        """
+        seekpathの対称k点（self.tbmodel.coord）について小群を求める。
+
+        Returns
+        -------
+        little_groups : dict
+            {k点ラベル: LittleGroup}
+        """
+        if self.tbmodel.path_coord is None:
+            self.tbmodel.get_sym_kpts()
+        return {
+            label: self.little_group(k, tol=tol)
+            for label, k in self.tbmodel.coord.items()
+        }
+
     def _get_site_amps(self, kidx, orb_idx):
         """
         指定したk点・バンドのサイトごとのアンプリチュード（波動関数成分）を取得する。
@@ -97,7 +147,7 @@ class GetCharacter:
             {(x, y, z): amp} の辞書
         """
         site_amps = {}
-        umat = self.Umat[:, kidx, orb_idx]  # nsite
+        umat = self.Umat[orb_idx, kidx, :]  # nsite
         pos = self.tbmodel.pos  # nsite, (x, y, z)
         nsites = pos.shape[0]
         for i in range(nsites):
@@ -126,6 +176,133 @@ class GetCharacter:
             #     site_amps[(x, y, z)] = umat[i]
         return site_amps
 
+    def _get_amp_tensor(self, kidxs, bands):
+        """
+        指定したk点・バンドのサイトごとのアンプリチュードをまとめて取得する。
+        _get_site_ampsと同じく self.Umat[band, k, site] の並びで読む。
+
+        Parameters
+        ----------
+        kidxs : array_like of int
+            k点インデックスの配列
+        bands : array_like of int
+            バンド（軌道）インデックスの配列
+
+        Returns
+        -------
+        amps : ndarray
+            (nk, nband, nsite) のアンプリチュード配列
+        """
+        umat = np.asarray(self.Umat)
+        amps = umat[bands][:, kidxs, :]  # nband, nk, nsite
+        return np.transpose(amps, (1, 0, 2))
+
+    def get_character_tensor(self, kidxs=None, bands=None, ops=None, tol=1e-6):
+        """
+        全k点・全バンド・全対称操作に対するキャラクターを一括で計算する。
+        get_character(mode="site")を各要素について呼んだ結果と同じ値を返す。
+
+        Parameters
+        ----------
+        kidxs : array_like of int, optional
+            k点インデックス（デフォルト: 全k点）
+        bands : array_like of int, optional
+            バンド（軌道）インデックス（デフォルト: 全バンド）
+        ops : array_like of int, optional
+            対称操作インデックス（デフォルト: 全対称操作）
+        tol : float
+            座標・アンプリチュード比較の許容誤差
+
+        Returns
+        -------
+        characters : ndarray
+            (nk, nband, nops) のキャラクター配列。
+            use_trace=Falseで一致するサイトが無い操作はnanとなる。
+        """
+        self._gen_point_group()
+        self._gen_space_group()
+        nops = self._get_symm_ops()
+        umat = np.asarray(self.Umat)
+        if kidxs is None:
+            kidxs = np.arange(umat.shape[1])
+        if bands is None:
+            bands = np.arange(umat.shape[0])
+        if ops is None:
+            ops = np.arange(nops)
+        kidxs = np.atleast_1d(np.asarray(kidxs, dtype=int))
+        bands = np.atleast_1d(np.asarray(bands, dtype=int))
+        ops = np.atleast_1d(np.asarray(ops, dtype=int))
+
+        amps = self._get_amp_tensor(kidxs, bands)  # nk, nband, nsite
+        perm = self.symm_ctx.site_permutation(tol=tol)
+        nsite = amps.shape[-1]
+
+        if self.use_trace:
+            # check_symmetry2: 不動サイトごとに±1を足し上げる
+            fixed = perm.fixed_sites()[ops].astype(float)  # nops, nsite
+            sign = np.where(np.abs(2 * amps) < tol, -1.0, 1.0)
+            return np.einsum("kbs,gs->kbg", sign, fixed)
+
+        # check_symmetry: 最後に一致したサイト対 (i, j) の符号を返す
+        # サイトjの像はサイト perm[g, j] なので、i は perm の最大値、
+        # j はその値をとる最後のインデックスとなる
+        pg = perm.perm[ops]  # nops, nsite
+        ii = pg.max(axis=1)
+        has_match = ii >= 0
+        is_last = pg == ii[:, None]
+        jj = nsite - 1 - np.argmax(is_last[:, ::-1], axis=1)
+        ii = np.where(has_match, ii, 0)
+        amp_i = amps[:, :, ii]  # nk, nband, nops
+        amp_j = amps[:, :, jj]
+        characters = np.where(
+            np.abs(amp_i + amp_j) < tol,
+            -1.0,
+            np.where(np.abs(amp_i - amp_j) < tol, 1.0, 0.0),
+        )
+        characters[:, :, ~has_match] = np.nan
+        return characters
+
+    def get_bloch_character(self, kidxs=None, bands=None, tol=1e-6):
+        """
+        Bloch位相 e^{-ik・G} を含めた表現行列 D(g, k) によるキャラクターを計算する。
+        各k点について小群の操作のみ評価し、
+        einsum('bi,gij,bj->bg', conj(U), D, U) を全バンドまとめて求める。
+        Uはpythtbの規約どおり self.Umat[band, k, orbital] として読む。
+
+        Parameters
+        ----------
+        kidxs : array_like of int, optional
+            k点インデックス（デフォルト: 全k点）
+        bands : array_like of int, optional
+            バンドインデックス（デフォルト: 全バンド）
+        tol : float
+            座標・k点比較の許容誤差
+
+        Returns
+        -------
+        characters : ndarray
+            (nk, nband, nops) の複素キャラクター配列。
+            kの小群に属さない操作はnanとなる。
+        """
+        nops = self._get_symm_ops()
+        umat = np.asarray(self.Umat)
+        kpts = np.asarray(self.tbmodel.kpts, dtype=float)
+        if kidxs is None:
+            kidxs = np.arange(umat.shape[1])
+        if bands is None:
+            bands = np.arange(umat.shape[0])
+        kidxs = np.atleast_1d(np.asarray(kidxs, dtype=int))
+        bands = np.atleast_1d(np.asarray(bands, dtype=int))
+        perm = self.symm_ctx.site_permutation(tol=tol)
+
+        characters = np.full((len(kidxs), len(bands), nops), np.nan, dtype=complex)
+        for n, kidx in enumerate(kidxs):
+            k = kpts[kidx]
+            ops = self.symm_ctx.little_group(k, tol=tol).ops
+            U = umat[bands, kidx, :]  # nband, nsite
+            characters[n][:, ops] = perm.bloch_characters(U, k, ops)
+        return characters
+
     def _get_grid_amps(self, kidx, orb_idx):
         """
         グリッド上のアンプリチュード（波動関数成分）を取得する（未実装）。
@@ -181,7 +358,7 @@ class GetCharacter:
             logger.info(f"before: {amps}")
             logger.info(f"after: {result}")
             if self.use_trace:
-                op_name, _ = find_operation_type(self.rot_o3[op_idx])
+                op_name, _ = self.symm_ctx.op_classes[op_idx]
                 charcter = check_symmetry2(amps, result)
                 logger.info(f"op_name: {op_name}, character: {charcter}")
             else:
@@ -1,7 +1,15 @@
 ## 点群ごとにファイルを作り対称操作の表現と記号をまとめる
 from .pg_ch_extra import get_pg_ch
 from .transform import tr2o3, from_o3, is_similar_symmetry_name
-from .judge_pg_sym_op import find_operation_type
+from .judge_pg_sym_op import find_operation_type, lookup_operation, classify_many
+from .character_table import CharacterTable, get_character_tables
 from .output_manager import output_sym_op_name
+from .conjugacy import (
+    multiplication_table,
+    conjugacy_classes,
+    element_orders,
+    assign_class_ids,
+)
 
 point_group = get_pg_ch()
+character_tables = get_character_tables()
@@ -0,0 +1,91 @@
+# pg_ch_extraの指標表を数値配列にまとめたもの
+import re
+from functools import lru_cache
+from types import MappingProxyType
+import numpy as np
+from .pg_ch_extra import get_pg_ch
+
+
+class CharacterTable:
+    """
+    1つの点群の指標表。構築後は読み取り専用。
+
+    Attributes
+    ----------
+    name : str
+        点群のSchonflies記号
+    class_names : tuple of str
+        クラス名（"8C3"などpg_ch_extraのキー）
+    class_index : mapping
+        {クラス名: クラス番号}
+    class_sizes : ndarray
+        各クラスの元の数
+    irrep_names : tuple of str
+        既約表現名（"G1", "G2", ...）
+    table : ndarray
+        (nclass, nirrep) の指標
+    """
+
+    def __init__(self, name, ch_dict):
+        """
+        Parameters
+        ----------
+        name : str
+            点群のSchonflies記号
+        ch_dict : dict
+            {クラス名: 各既約表現の指標のリスト}（pg_ch_extraの形式）
+        """
+        self.name = name
+        self.class_names = tuple(ch_dict.keys())
+        self.class_index = MappingProxyType(
+            {k: i for i, k in enumerate(self.class_names)}
+        )
+        self.class_sizes = np.array(
+            [_class_size(k) for k in self.class_names], dtype=int
+        )
+        self.table = np.array([ch_dict[k] for k in self.class_names], dtype=float)
+        self.irrep_names = tuple(f"G{i + 1}" for i in range(self.table.shape[1]))
+        for arr in (self.class_sizes, self.table):
+            arr.setflags(write=False)
+
+    @property
+    def order(self):
+        return int(self.class_sizes.sum())
+
+    @property
+    def nclass(self):
+        return self.table.shape[0]
+
+    @property
+    def nirrep(self):
+        return self.table.shape[1]
+
+    def character(self, class_name, ir_idx):
+        """
+        クラス名と既約表現番号から指標を返す。
+        """
+        return self.table[self.class_index[class_name], ir_idx]
+
+
+def _class_size(class_name):
+    """
+    "8C3"のようなクラス名の先頭の数字からクラスの元の数を求める。
+    """
+    m = re.match(r"\d+", class_name)
+    if m is None:
+        return 1
+    return int(m.group())
+
+
+@lru_cache(maxsize=None)
+def get_character_tables():
+    """
+    全32点群のCharacterTableを返す。初回呼び出し時に一度だけ構築する。
+
+    Returns
+    -------
+    tables : mapping
+        {Schonflies記号: CharacterTable}
+    """
+    tables = {name: CharacterTable(name, ch) for name, ch in get_pg_ch().items()}
+    return MappingProxyType(tables)
@@ -0,0 +1,201 @@
+# 群の積表から共役類を求め、指標表のクラスに対応させる
+import re
+import numpy as np
+from .character_table import get_character_tables
+
+
+def multiplication_table(rot):
+    """
+    整数回転行列の集合から群の積表を作る。
+
+    Parameters
+    ----------
+    rot : array_like
+        (nops, 3, 3) の整数回転行列（重複なし）
+
+    Returns
+    -------
+    mult : ndarray
+        mult[a, b] は rot[a] @ rot[b] のインデックス
+    """
+    rot = np.asarray(rot, dtype=np.int64)
+    nops = rot.shape[0]
+    index = {R.tobytes(): i for i, R in enumerate(rot)}
+    prod = np.einsum("aij,bjk->abik", rot, rot).reshape(nops * nops, 3, 3)
+    prod = np.ascontiguousarray(prod)
+    try:
+        mult = np.array([index[R.tobytes()] for R in prod], dtype=int)
+    except KeyError:
+        raise ValueError("回転行列の集合が積について閉じていません。")
+    return mult.reshape(nops, nops)
+
+
+def conjugacy_classes(mult):
+    """
+    積表から共役類を求める。
+
+    Returns
+    -------
+    class_of : ndarray
+        各元の共役類番号 (nops,)
+    classes : list of ndarray
+        各共役類に属する元のインデックス
+    """
+    nops = mult.shape[0]
+    identity = int(np.where(np.all(mult == np.arange(nops)[None, :], axis=1))[0][0])
+    inv = np.argmax(mult == identity, axis=1)
+    class_of = np.full(nops, -1, dtype=int)
+    classes = []
+    for a in range(nops):
+        if class_of[a] >= 0:
+            continue
+        # g a g^-1 を全てのgについて集める
+        members = np.unique(mult[mult[:, a], inv])
+        class_of[members] = len(classes)
+        classes.append(members)
+    return class_of, classes
+
+
+def element_orders(mult):
+    """
+    積表から各元の位数を求める。
+    """
+    nops = mult.shape[0]
+    identity = int(np.where(np.all(mult == np.arange(nops)[None, :], axis=1))[0][0])
+    orders = np.ones(nops, dtype=int)
+    power = np.arange(nops)
+    active = power != identity
+    while np.any(active):
+        power[active] = mult[power[active], np.arange(nops)[active]]
+        orders += active
+        active = power != identity
+    return orders
+
+
+def _class_signature(class_name):
+    """
+    指標表のクラス名から (位数, 行列式, トレース) を求める。
+    """
+    name = re.sub(r"^\d+", "", class_name)
+    if name == "E":
+        return 1, 1, 3
+    if name == "i":
+        return 2, -1, -3
+    if name.startswith("sigma"):
+        return 2, -1, 1
+    m = re.match(r"([CS])(\d+)", name)
+    if m is None:
+        raise ValueError(f"不明なクラス名です: {class_name}")
+    n = int(m.group(2))
+    trace = int(round(2 * np.cos(2 * np.pi / n)))
+    if m.group(1) == "C":
+        return n, 1, 1 + trace
+    order = n if n % 2 == 0 else 2 * n
+    return order, -1, -1 + trace
+
+
+_AXES = {"x": 0, "y": 1, "z": 2}
+
+
+def _cart_axis(rot, cell):
+    """
+    回転行列（分率座標）のデカルト座標での回転軸（鏡映なら法線）を返す。
+    """
+    L = np.asarray(cell, dtype=float).T
+    C = L @ rot @ np.linalg.inv(L)
+    if np.linalg.det(C) < 0:
+        C = -C
+    w, v = np.linalg.eig(C)
+    idx = np.argmin(np.abs(w - 1.0))
+    axis = np.real(v[:, idx])
+    return axis / np.linalg.norm(axis)
+
+
+def _along(axis, name):
+    return abs(abs(axis[_AXES[name]]) - 1.0) < 1e-6
+
+
+def _class_predicate(class_name):
+    """
+    同じ (位数, 行列式, トレース) を持つクラスを区別するための、
+    軸の向きに関する条件を返す（条件が無ければNone）。
+    主軸はz、C2'・σvを含む向きはx軸とする。
+    """
+    name = re.sub(r"^\d+", "", class_name)
+    m = re.match(r"C2\(([xyz])\)", name)
+    if m:
+        return lambda axes: any(_along(a, m.group(1)) for a in axes)
+    if name.startswith("sigma"):
+        plane = re.sub(r"[^xyz]", "", name[len("sigma"):])
+        if len(plane) == 2:
+            normal = ({"x", "y", "z"} - set(plane)).pop()
+            return lambda axes: any(_along(a, normal) for a in axes)
+        if name == "sigmav":
+            return lambda axes: any(_along(a, "y") for a in axes)
+        if name == "sigmad":
+            return lambda axes: not any(_along(a, "y") for a in axes)
+    if name.endswith("_1"):
+        return lambda axes: any(_along(a, "x") for a in axes)
+    if name.endswith("_2"):
+        return lambda axes: not any(_along(a, "x") for a in axes)
+    return None
+
+
+def assign_class_ids(rot, pg, cell=None):
+    """
+    各対称操作を指標表（CharacterTable）のクラス番号に対応させる。
+    積表から求めた共役類ごとに (位数, 行列式, トレース) で候補を絞り、
+    候補が複数あればクラスの大きさ、さらに回転軸の向きで決める。
+    並進だけが異なる操作（同じ回転行列）は同じクラスになる。
+
+    Parameters
+    ----------
+    rot : array_like
+        (nops, 3, 3) の整数回転行列（分率座標）
+    pg : str
+        点群のSchonflies記号
+    cell : array_like, optional
+        格子ベクトル（回転軸の向きの判定に使う。デフォルト: 単位行列）
+
+    Returns
+    -------
+    class_ids : ndarray
+        各操作のクラス番号 (nops,)。対応するクラスが無い場合は-1。
+    """
+    rot = np.asarray(rot, dtype=np.int64)
+    if cell is None:
+        cell = np.eye(3)
+    # 心付き格子や超格子では同じ回転が並進ごとに繰り返されるので、
+    # 重複を除いた点群の回転について積表を作る
+    rot, inverse = np.unique(
+        rot.reshape(rot.shape[0], 9), axis=0, return_inverse=True
+    )
+    rot = rot.reshape(-1, 3, 3)
+    table = get_character_tables()[pg]
+    mult = multiplication_table(rot)
+    class_of, classes = conjugacy_classes(mult)
+    orders = element_orders(mult)
+    col_sig = [_class_signature(k) for k in table.class_names]
+    col_pred = [_class_predicate(k) for k in table.class_names]
+
+    class_ids = np.full(rot.shape[0], -1, dtype=int)
+    for members in classes:
+        rep = members[0]
+        sig = (
+            orders[rep],
+            int(round(np.linalg.det(rot[rep]))),
+            int(np.trace(rot[rep])),
+        )
+        cand = [c for c, s in enumerate(col_sig) if s == sig]
+        if len(cand) > 1:
+            same_size = [c for c in cand if table.class_sizes[c] == len(members)]
+            if same_size:
+                cand = same_size
+        if len(cand) > 1:
+            axes = [_cart_axis(rot[g], cell) for g in members]
+            oriented = [c for c in cand if col_pred[c] is not None and col_pred[c](axes)]
+            if oriented:
+                cand = oriented
+        if cand:
+            class_ids[members] = cand[0]
+    return class_ids[inverse.reshape(-1)]
@@ -1,5 +1,6 @@
 import numpy as np
 from itertools import permutations, product
+from functools import lru_cache
 import math
 
 def generate_all_representation_matrices(n=3):
@@ -203,9 +204,68 @@ def analyze_all_operations(principal_axis='z'):
     
     return operations
 
+## (行列のバイト列, 主軸) -> (op_name, description)
+_OPERATION_TABLE = {}
+
+
+def _int_key(matrix):
+    return np.asarray(matrix, dtype=np.int8).tobytes()
+
+
+def _build_operation_table(principal_axis):
+    """整数のO(3)行列（符号付き置換行列48個）の分類表を作る"""
+    table = {}
+    for matrix in generate_all_representation_matrices(3):
+        op_name, description = classify_symmetry_operation(matrix, principal_axis)
+        table[_int_key(matrix)] = (op_name, description)
+    return table
+
+
+@lru_cache(maxsize=1024)
+def _classify_cached(matrix_bytes, dtype, principal_axis):
+    """分類表に無い行列の分類（LRUキャッシュ付き）"""
+    matrix = np.frombuffer(matrix_bytes, dtype=dtype).reshape(3, 3)
+    return classify_symmetry_operation(matrix, principal_axis)
+
+
+def lookup_operation(matrix, principal_axis='z'):
+    """
+    対称操作行列を分類表から引いて (op_name, description) を返す。
+    指標表のクラス番号はSymmetryContext.class_ids()（積表による共役類）で求める。
+    整数行列は事前計算した表、それ以外はLRUキャッシュ付きの
+    classify_symmetry_operationで分類する。
+    """
+    matrix = np.asarray(matrix)
+    if principal_axis not in _OPERATION_TABLE:
+        _OPERATION_TABLE[principal_axis] = _build_operation_table(principal_axis)
+    rounded = np.rint(matrix)
+    if np.array_equal(matrix, rounded) and np.all(np.abs(rounded) <= 1):
+        ret = _OPERATION_TABLE[principal_axis].get(_int_key(rounded))
+        if ret is not None:
+            return ret
+    matrix = np.ascontiguousarray(matrix)
+    return _classify_cached(matrix.tobytes(), matrix.dtype.str, principal_axis)
+
+
+def classify_many(rot_array, principal_axis='z'):
+    """
+    複数の対称操作行列 (nops, 3, 3) をまとめて分類する。
+
+    Returns
+    -------
+    results : list of tuple
+        各操作の (op_name, description)
+    """
+    rot_array = np.ascontiguousarray(rot_array)
+    flat = rot_array.reshape(rot_array.shape[0], 9)
+    uniq, inverse = np.unique(flat, axis=0, return_inverse=True)
+    classified = [lookup_operation(m.reshape(3, 3), principal_axis) for m in uniq]
+    return [classified[i] for i in np.ravel(inverse)]
+
+
 def find_operation_type(target_matrix, principal_axis='z'):
     """特定の行列の操作タイプを判定"""
-    op_name, description = classify_symmetry_operation(target_matrix, principal_axis)
+    op_name, description = lookup_operation(target_matrix, principal_axis)
     # print(f"Matrix:")
     # for row in target_matrix:
     #     print(f"  {row}")
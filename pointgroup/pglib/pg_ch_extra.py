@@ -158,7 +158,7 @@ def get_pg_ch():
         "2C6":  [1, 1,-1,-1, 1,-1],
         "2C3":  [1, 1, 1, 1,-1,-1],
         "C2":   [1, 1,-1,-1,-2, 2],
-        "3C2_1":[1,-1, 1 -1, 0, 0],
+        "3C2_1":[1,-1, 1,-1, 0, 0],
         "3C2_2":[1,-1,-1, 1, 0, 0],
     }
 
@@ -182,7 +182,7 @@ def get_pg_ch():
 
     pg_ch_extra["D6h"] = { #### 注意
         "E":       [1, 1, 1, 1, 1, 1, 1, 1, 2, 2, 2, 2],
-        "2C6":     [1, 1, 1, 1,-1,-1,-1,-1, 1, 1,-1 -1],
+        "2C6":     [1, 1, 1, 1,-1,-1,-1,-1, 1, 1,-1,-1],
         "2C3":     [1, 1, 1, 1, 1, 1, 1, 1,-1,-1,-1,-1],
         "C2":      [1, 1, 1, 1,-1,-1,-1,-1,-2,-2, 2, 2],
         "3C2_1":   [1, 1,-1,-1, 1, 1,-1,-1, 0, 0, 0, 0],
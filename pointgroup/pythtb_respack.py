@@ -25,6 +25,23 @@ __version__ = "1.7.2"
 import numpy as np  # numerics for matrices
 import sys  # for exiting
 import copy  # for deepcopying
+import os  # for BLAS thread settings of worker processes
+import struct  # for reading headers of cached arrays
+import tempfile  # for memory-mapped storage of w90 R-blocks and wf_array
+import zipfile
+import contextlib
+import multiprocessing  # for parallel solve_all
+from multiprocessing import shared_memory
+from scipy import sparse  # for scattering hoppings into matrices
+from scipy.sparse import linalg as sparse_linalg  # for solve_window
+from scipy.optimize import linear_sum_assignment  # for _array_phases_cont
+
+# memory (in bytes) used by work arrays of one chunk of k-points in solve_all
+SOLVE_MEMORY_BUDGET = 256 * 1024**2
+# memory (in bytes) used by work arrays of one chunk of R-blocks in w90
+W90_MEMORY_BUDGET = 256 * 1024**2
+# memory (in bytes) used by one chunk of wavefunctions read from wf_array
+WF_MEMORY_BUDGET = 256 * 1024**2
 
 
 class tb_model(object):
@@ -191,6 +208,10 @@ class tb_model(object):
 
         # Initialize hoppings to empty list
         self._hoppings = []
+        # compiled array form of the hoppings, built lazily
+        self._hop_arrays = None
+        # index of hoppings keyed on (i,j,R), built lazily
+        self._hop_index = None
 
         # The onsite energies and hoppings are not specified
         # when creating a 'tb_model' object.  They are speficied
@@ -332,6 +353,7 @@ class tb_model(object):
         if self._nspin == 2:
             self._site_energies[:, 0, 0] += self.soc
             self._site_energies[:, 1, 1] -= self.soc
+        self._invalidate_hop_arrays(keep_index=True)
 
     def set_hop(
         self, hop_amp, ind_i, ind_j, ind_R=None, mode="set", allow_conjugate_pair=False
@@ -486,43 +508,10 @@ class tb_model(object):
                     )
         #
         # make sure that if <i|H|j+R> is specified that <j|H|i-R> is not!
+        hop_index = self._get_hop_index()
         if allow_conjugate_pair == False:
-            for h in self._hoppings:
-                if ind_i == h[2] and ind_j == h[1]:
-                    if self._dim_k == 0:
-                        raise Exception(
-                            """\n
-Following matrix element was already implicitely specified:
-   i="""
-                            + str(ind_i)
-                            + " j="
-                            + str(ind_j)
-                            + """
-Remember, specifying <i|H|j> automatically specifies <j|H|i>.  For
-consistency, specify all hoppings for a given bond in the same
-direction.  (Or, alternatively, see the documentation on the
-'allow_conjugate_pair' flag.)
-"""
-                        )
-                    elif False not in (
-                        np.array(ind_R)[self._per] == (-1) * np.array(h[3])[self._per]
-                    ):
-                        raise Exception(
-                            """\n
-Following matrix element was already implicitely specified:
-   i="""
-                            + str(ind_i)
-                            + " j="
-                            + str(ind_j)
-                            + " R="
-                            + str(ind_R)
-                            + """
-Remember,specifying <i|H|j+R> automatically specifies <j|H|i-R>.  For
-consistency, specify all hoppings for a given bond in the same
-direction.  (Or, alternatively, see the documentation on the
-'allow_conjugate_pair' flag.)
-"""
-                        )
+            if self._conj_hop_key(ind_i, ind_j, ind_R) in hop_index:
+                raise self._conjugate_pair_error(ind_i, ind_j, ind_R)
         # convert to 2by2 matrix if needed
         hop_use = self._val_to_block(hop_amp)
         # hopping term parameters to be stored
@@ -532,21 +521,8 @@ direction.  (Or, alternatively, see the documentation on the
             new_hop = [hop_use, int(ind_i), int(ind_j), np.array(ind_R)]
         #
         # see if there is a hopping term with same i,j,R
-        use_index = None
-        for iih, h in enumerate(self._hoppings):
-            # check if the same
-            same_ijR = False
-            if ind_i == h[1] and ind_j == h[2]:
-                if self._dim_k == 0:
-                    same_ijR = True
-                else:
-                    if False not in (
-                        np.array(ind_R)[self._per] == np.array(h[3])[self._per]
-                    ):
-                        same_ijR = True
-            # if they are the same then store index of site at which they are the same
-            if same_ijR == True:
-                use_index = iih
+        key = self._hop_key(ind_i, ind_j, ind_R)
+        use_index = hop_index.get(key)
         #
         # specifying hopping terms from scratch, can be called only once
         if mode.lower() == "set":
@@ -556,21 +532,247 @@ direction.  (Or, alternatively, see the documentation on the
                     '\n\nHopping energy for this site was already specified! Use mode="reset" or mode="add".'
                 )
             else:
+                hop_index[key] = len(self._hoppings)
                 self._hoppings.append(new_hop)
         # reset value of hopping term, without adding to previous value
         elif mode.lower() == "reset":
             if use_index != None:
                 self._hoppings[use_index] = new_hop
             else:
+                hop_index[key] = len(self._hoppings)
                 self._hoppings.append(new_hop)
         # add to previous value
         elif mode.lower() == "add":
             if use_index != None:
                 self._hoppings[use_index][0] += new_hop[0]
             else:
+                hop_index[key] = len(self._hoppings)
                 self._hoppings.append(new_hop)
         else:
             raise Exception("\n\nWrong value of mode parameter")
+        self._invalidate_hop_arrays(keep_index=True)
+
+    def set_hops(self, hop_amps, ind_i, ind_j, ind_R=None, mode="set", allow_conjugate_pair=False):
+        r"""
+
+        Defines many hopping parameters at once. This is equivalent to
+        calling :func:`pythtb.tb_model.set_hop` for each hopping in
+        turn, but input is checked for all hoppings together, which is
+        much faster for models with many hoppings.
+
+        :param hop_amps: Hopping amplitudes. If *nspin* is *1* this is
+          an array of numbers. If *nspin* is *2* this is an array of
+          numbers, an array of shape (nhop,4) or an array of 2x2
+          matrices, interpreted as in :func:`pythtb.tb_model.set_hop`.
+
+        :param ind_i: Array of indices of bra orbitals.
+
+        :param ind_j: Array of indices of ket orbitals.
+
+        :param ind_R: Array of shape (nhop,dim_r) with lattice vectors
+          of the ket orbitals. If *dim_k* is *1* it can also be given
+          as an array of integers. Should not be given if reciprocal
+          space is zero-dimensional.
+
+        :param mode: Same as in :func:`pythtb.tb_model.set_hop`. For
+          "set" the same triplet *ind_i*, *ind_j*, *ind_R* can appear
+          only once, while for "reset" and "add" hoppings are applied
+          in the order given.
+
+        :param allow_conjugate_pair: Same as in
+          :func:`pythtb.tb_model.set_hop`.
+
+        Example usage::
+
+          # three nearest-neighbour hoppings of graphene
+          tb.set_hops([t, t, t], [0, 0, 0], [1, 1, 1], [[0, 0], [-1, 0], [0, -1]])
+
+        """
+        if mode.lower() not in ["set", "reset", "add"]:
+            raise Exception("\n\nWrong value of mode parameter")
+        ind_i = np.array(ind_i, dtype=int).reshape(-1)
+        ind_j = np.array(ind_j, dtype=int).reshape(-1)
+        nhop = len(ind_i)
+        if len(ind_j) != nhop:
+            raise Exception("\n\nArrays ind_i and ind_j must have the same length!")
+        if self._dim_k != 0:
+            if ind_R is None:
+                raise Exception("\n\nNeed to specify ind_R!")
+            ind_R = np.array(ind_R)
+            # if necessary convert from integers to vectors
+            if self._dim_k == 1 and ind_R.shape == (nhop,):
+                tmpR = np.zeros((nhop, self._dim_r), dtype=int)
+                tmpR[:, self._per[0]] = ind_R
+                ind_R = tmpR
+            if ind_R.shape != (nhop, self._dim_r):
+                raise Exception(
+                    "\n\nLength of input ind_R vector must equal dim_r! Even if dim_k<dim_r."
+                )
+            per_R = ind_R[:, self._per]
+        else:
+            per_R = np.zeros((nhop, 0), dtype=int)
+        # make sure ind_i and ind_j are not out of scope
+        if np.any((ind_i < 0) | (ind_i >= self._norb)):
+            raise Exception("\n\nIndex ind_i out of scope.")
+        if np.any((ind_j < 0) | (ind_j >= self._norb)):
+            raise Exception("\n\nIndex ind_j out of scope.")
+        # do not allow onsite hoppings
+        if np.any((ind_i == ind_j) & np.all(np.array(per_R, dtype=int) == 0, axis=1)):
+            raise Exception(
+                "\n\nDo not use set_hop for onsite terms. Use set_onsite instead!"
+            )
+        hop_amps = self._vals_to_blocks(hop_amps, nhop)
+        keys = list(zip(ind_i.tolist(), ind_j.tolist(), map(tuple, per_R.tolist())))
+        hop_index = self._get_hop_index()
+        # make sure that if <i|H|j+R> is specified that <j|H|i-R> is not!
+        if allow_conjugate_pair == False:
+            key_set = set(keys)
+            for n, (i, j, R) in enumerate(keys):
+                conj_key = (j, i, tuple(-x for x in R))
+                if conj_key in hop_index or conj_key in key_set:
+                    raise self._conjugate_pair_error(i, j, ind_R[n] if self._dim_k != 0 else None)
+        if mode.lower() == "set":
+            if len(set(keys)) != nhop or any(key in hop_index for key in keys):
+                raise Exception(
+                    '\n\nHopping energy for this site was already specified! Use mode="reset" or mode="add".'
+                )
+        for n, key in enumerate(keys):
+            if self._dim_k == 0:
+                new_hop = [hop_amps[n], int(ind_i[n]), int(ind_j[n])]
+            else:
+                new_hop = [hop_amps[n], int(ind_i[n]), int(ind_j[n]), np.array(ind_R[n])]
+            use_index = hop_index.get(key)
+            if use_index is None:
+                hop_index[key] = len(self._hoppings)
+                self._hoppings.append(new_hop)
+            elif mode.lower() == "reset":
+                self._hoppings[use_index] = new_hop
+            elif mode.lower() == "add":
+                self._hoppings[use_index][0] += new_hop[0]
+        self._invalidate_hop_arrays(keep_index=True)
+
+    def _hop_key(self, ind_i, ind_j, ind_R):
+        """Key of hopping <i|H|j+R> in the hopping index, only periodic
+        components of R are used."""
+        if self._dim_k == 0:
+            return (int(ind_i), int(ind_j), ())
+        return (int(ind_i), int(ind_j), tuple(np.array(ind_R)[self._per].tolist()))
+
+    def _conj_hop_key(self, ind_i, ind_j, ind_R):
+        """Key of conjugate pair <j|H|i-R> of hopping <i|H|j+R>"""
+        if self._dim_k == 0:
+            return (int(ind_j), int(ind_i), ())
+        return (int(ind_j), int(ind_i), tuple((-np.array(ind_R)[self._per]).tolist()))
+
+    def _get_hop_index(self):
+        """Returns dictionary mapping key (i,j,R) of each hopping to its
+        position in the list of hoppings. If a key appears more than
+        once, the last position is stored, as in the linear search it
+        replaces."""
+        if self._hop_index is None:
+            self._hop_index = {}
+            for iih, h in enumerate(self._hoppings):
+                if self._dim_k == 0:
+                    key = self._hop_key(h[1], h[2], None)
+                else:
+                    key = self._hop_key(h[1], h[2], h[3])
+                self._hop_index[key] = iih
+        return self._hop_index
+
+    def _conjugate_pair_error(self, ind_i, ind_j, ind_R):
+        """Exception raised when conjugate pair of a hopping was already
+        specified."""
+        if self._dim_k == 0:
+            return Exception(
+                """\n
+Following matrix element was already implicitely specified:
+   i="""
+                + str(ind_i)
+                + " j="
+                + str(ind_j)
+                + """
+Remember, specifying <i|H|j> automatically specifies <j|H|i>.  For
+consistency, specify all hoppings for a given bond in the same
+direction.  (Or, alternatively, see the documentation on the
+'allow_conjugate_pair' flag.)
+"""
+            )
+        return Exception(
+            """\n
+Following matrix element was already implicitely specified:
+   i="""
+            + str(ind_i)
+            + " j="
+            + str(ind_j)
+            + " R="
+            + str(ind_R)
+            + """
+Remember,specifying <i|H|j+R> automatically specifies <j|H|i-R>.  For
+consistency, specify all hoppings for a given bond in the same
+direction.  (Or, alternatively, see the documentation on the
+'allow_conjugate_pair' flag.)
+"""
+        )
+
+    def _invalidate_hop_arrays(self, keep_index=False):
+        """Drops the compiled hopping arrays, and unless keep_index is
+        True also the hopping index. Has to be called whenever
+        hoppings, orbitals or periodic directions are modified."""
+        self._hop_arrays = None
+        if keep_index == False:
+            self._hop_index = None
+
+    def _get_hop_arrays(self):
+        """Returns hoppings compiled into contiguous arrays: amplitudes,
+        indices i and j, periodic components of the vectors
+        -orb[i]+orb[j]+R that enter the Bloch phase, and a sparse
+        matrix that scatters terms into the flattened (i,j) element of
+        the Hamiltonian. Arrays are built once and reused until the
+        model is modified."""
+        if self._hop_arrays is None:
+            nhop = len(self._hoppings)
+            if self._nspin == 1:
+                amp = np.array([h[0] for h in self._hoppings], dtype=complex)
+            elif self._nspin == 2:
+                amp = np.array([h[0] for h in self._hoppings], dtype=complex)
+                amp = amp.reshape((nhop, 2, 2))
+            hop_i = np.array([h[1] for h in self._hoppings], dtype=int)
+            hop_j = np.array([h[2] for h in self._hoppings], dtype=int)
+            if self._dim_k > 0:
+                ind_R = np.array([h[3] for h in self._hoppings], dtype=float)
+                ind_R = ind_R.reshape((nhop, self._dim_r))
+                rv = -self._orb[hop_i, :] + self._orb[hop_j, :] + ind_R
+                rv = rv[:, self._per]
+            else:
+                rv = np.zeros((nhop, 0), dtype=float)
+            scatter = sparse.csc_matrix(
+                (np.ones(nhop), (hop_i * self._norb + hop_j, np.arange(nhop))),
+                shape=(self._norb * self._norb, nhop),
+            )
+            self._hop_arrays = (amp, hop_i, hop_j, rv, scatter)
+        return self._hop_arrays
+
+    def _vals_to_blocks(self, vals, nval):
+        """Array version of _val_to_block, converts nval values at once.
+        If nspin=1 returns them as an array of numbers."""
+        use_val = np.array(vals)
+        if self._nspin == 1:
+            if use_val.shape != (nval,):
+                raise Exception("\n\nWrong number of hopping amplitudes!")
+            return use_val
+        pauli = np.array(
+            [[[1, 0], [0, 1]], [[0, 1], [1, 0]], [[0, -1.0j], [1.0j, 0]], [[1, 0], [0, -1]]],
+            dtype=complex,
+        )
+        if use_val.shape == (nval,):
+            return use_val[:, None, None] * pauli[0][None, :, :]
+        elif use_val.shape == (nval, 4):
+            return np.einsum("na,aij->nij", use_val, pauli)
+        elif use_val.shape == (nval, 2, 2):
+            return use_val
+        raise Exception(
+            "\n\nWrong format of the hopping terms. Each must be single number, or array of length 4, or 2x2 matrix."
+        )
 
     def _val_to_block(self, val):
         """If nspin=2 then returns a 2 by 2 matrix from the input
@@ -1009,47 +1211,86 @@ matrix."""
             # check that k-vector is of corect size
             if kpnt.shape != (self._dim_k,):
                 raise Exception("\n\nk-vector of wrong shape!")
+            return self.gen_ham_batch([kpnt])[0]
         else:
             if self._dim_k != 0:
                 raise Exception("\n\nHave to provide a k-vector!")
-        # zero the Hamiltonian matrix
-        if self._nspin == 1:
-            ham = np.zeros((self._norb, self._norb), dtype=complex)
-        elif self._nspin == 2:
-            ham = np.zeros((self._norb, 2, self._norb, 2), dtype=complex)
-        # modify diagonal elements
-        for i in range(self._norb):
-            if self._nspin == 1:
-                ham[i, i] = self._site_energies[i]
-            elif self._nspin == 2:
-                ham[i, :, i, :] = self._site_energies[i]
-        # go over all hoppings
-        for hopping in self._hoppings:
-            # get all data for the hopping parameter
-            if self._nspin == 1:
-                amp = complex(hopping[0])
-            elif self._nspin == 2:
-                amp = np.array(hopping[0], dtype=complex)
-            i = hopping[1]
-            j = hopping[2]
-            # in 0-dim case there is no phase factor
-            if self._dim_k > 0:
-                ind_R = np.array(hopping[3], dtype=float)
-                # vector from one site to another
-                rv = -self._orb[i, :] + self._orb[j, :] + ind_R
-                # Take only components of vector which are periodic
-                rv = rv[self._per]
-                # Calculate the hopping, see details in info/tb/tb.pdf
-                phase = np.exp((2.0j) * np.pi * np.dot(kpnt, rv))
-                amp = amp * phase
-            # add this hopping into a matrix and also its conjugate
-            if self._nspin == 1:
-                ham[i, j] += amp
-                ham[j, i] += amp.conjugate()
-            elif self._nspin == 2:
-                ham[i, :, j, :] += amp
-                ham[j, :, i, :] += amp.T.conjugate()
-        return ham
+            return self.gen_ham_batch()[0]
+
+    def gen_ham_batch(self, k_list=None):
+        r"""
+        Generates Hamiltonians for many k-points at once. Bloch phases
+        for all k-points and all hoppings are obtained from a single
+        matrix product and scattered into the Hamiltonian with a sparse
+        matrix, using hoppings compiled by the model.
+
+        :param k_list: Array of k-vectors in reduced coordinates, of
+          shape (nk, dim_k). Should not be given for a model with
+          zero-dimensional k-space.
+
+        :returns:
+          * **ham** -- Array of Hamiltonians. If *nspin* equals 1 the
+            format is ham[kpoint,orbital,orbital], otherwise it is
+            ham[kpoint,orbital,spin,orbital,spin]. For zero-dimensional
+            k-space there is a single entry along the kpoint index.
+
+        Example usage::
+
+          # Hamiltonians at three k-points of a two-dimensional model
+          ham = tb.gen_ham_batch([[0.0, 0.0], [0.0, 0.2], [0.0, 0.5]])
+
+        """
+        if k_list is None:
+            if self._dim_k != 0:
+                raise Exception("\n\nHave to provide k-vectors!")
+            k_arr = np.zeros((1, 0), dtype=float)
+        else:
+            k_arr = self._k_array(k_list)
+        return _ham_from_arrays(
+            self._get_hop_arrays(), self._site_energies, self._norb, self._nspin, k_arr
+        )
+
+    def gen_ham_sparse(self, k_point=None):
+        r"""
+        Generates the Hamiltonian at one k-point as a sparse matrix in
+        CSR format, built directly from the list of hoppings without
+        allocating a dense matrix. Useful for large models, such as
+        those obtained from :func:`pythtb.tb_model.make_supercell` or
+        :func:`pythtb.tb_model.cut_piece`.
+
+        :param k_point: k-vector in reduced coordinates. Should not be
+          given for a model with zero-dimensional k-space.
+
+        :returns:
+          * **ham** -- Sparse matrix of shape (nsta,nsta). In the
+            spinfull case rows and columns are ordered as
+            (orbital,spin), the same as in the flattened dense
+            Hamiltonian.
+
+        Example usage::
+
+          # sparse Hamiltonian at Gamma point
+          ham = tb.gen_ham_sparse([0.0, 0.0])
+
+        """
+        if k_point is None:
+            if self._dim_k != 0:
+                raise Exception("\n\nHave to provide a k-vector!")
+            k_arr = np.zeros((1, 0), dtype=float)
+        else:
+            k_arr = self._k_array([k_point])
+        return _sparse_ham_from_arrays(
+            self._get_hop_arrays(), self._site_energies, self._norb, self._nspin, k_arr[0]
+        )
+
+    def _k_array(self, k_list):
+        """Converts list of k-vectors into array k_arr[kpoint,direction]"""
+        k_arr = np.array(k_list, dtype=float)
+        if self._dim_k == 1 and len(k_arr.shape) == 1:
+            k_arr = k_arr[:, None]
+        if len(k_arr.shape) != 2 or k_arr.shape[1] != self._dim_k:
+            raise Exception("\n\nk-vectors of wrong shape!")
+        return k_arr
 
     def _sol_ham(self, ham, eig_vectors=False):
         """Solves Hamiltonian and returns eigenvectors, eigenvalues"""
@@ -1079,7 +1320,10 @@ matrix."""
                 eig = eig.reshape((self._nsta, self._norb, 2))
             return (eval, eig)
 
-    def solve_all(self, k_list=None, eig_vectors=False):
+    def solve_all(
+        self, k_list=None, eig_vectors=False, chunk_size=None, herm_check="all",
+        n_workers=None
+    ):
         r"""
         Solves for eigenvalues and (optionally) eigenvectors of the
         tight-binding model on a given one-dimensional list of k-vectors.
@@ -1151,17 +1395,44 @@ matrix."""
             additional component evec[...,spin] corresponding to the
             spin component of the wavefunction.
 
+        :param chunk_size: Optional number of k-points whose
+          Hamiltonians are built and diagonalized together as one
+          stack. By default it is chosen so that the work arrays of one
+          chunk stay within *SOLVE_MEMORY_BUDGET* bytes.
+
+        :param herm_check: Optional parameter specifying how the
+          Hamiltonians are checked for hermiticity before
+          diagonalization. "all" (default) checks every k-point,
+          "sample" checks only the first k-point of each chunk and
+          "none" skips the check.
+
+        :param n_workers: Optional number of worker processes. If larger
+          than 1, the list of k-vectors is split into chunks that are
+          solved by a pool of processes. Compiled hoppings are sent to
+          each worker once, results are written directly into shared
+          memory and each worker uses a single BLAS thread. Workers are
+          started with the "spawn" method, so scripts calling this have
+          to be protected by *if __name__ == "__main__":*.
+
         Example usage::
 
           # Returns eigenvalues for three k-vectors
           eval = tb.solve_all([[0.0, 0.0], [0.0, 0.2], [0.0, 0.5]])
           # Returns eigenvalues and eigenvectors for two k-vectors
           (eval, evec) = tb.solve_all([[0.0, 0.0], [0.0, 0.2]], eig_vectors=True)
+          # Solves a dense mesh using four processes
+          eval = tb.solve_all(tb.k_uniform_mesh([100, 100]), n_workers=4)
 
         """
         # if not 0-dim case
         if not (k_list is None):
             nkp = len(k_list)  # number of k points
+            if herm_check not in ["all", "sample", "none"]:
+                raise Exception("\n\nWrong value of herm_check parameter")
+            if n_workers is not None and n_workers > 1 and nkp > 0:
+                return self._solve_all_parallel(
+                    k_list, eig_vectors, chunk_size, herm_check, n_workers
+                )
             # first initialize matrices for all return data
             #    indices are [band,kpoint]
             ret_eval = np.zeros((self._nsta, nkp), dtype=float)
@@ -1170,21 +1441,17 @@ matrix."""
                 ret_evec = np.zeros((self._nsta, nkp, self._norb), dtype=complex)
             elif self._nspin == 2:
                 ret_evec = np.zeros((self._nsta, nkp, self._norb, 2), dtype=complex)
-            # go over all kpoints
-            for i, k in enumerate(k_list):
-                # generate Hamiltonian at that point
-                ham = self._gen_ham(k)
-                # solve Hamiltonian
-                if eig_vectors == False:
-                    eval = self._sol_ham(ham, eig_vectors=eig_vectors)
-                    ret_eval[:, i] = eval[:]
-                else:
-                    (eval, evec) = self._sol_ham(ham, eig_vectors=eig_vectors)
-                    ret_eval[:, i] = eval[:]
-                    if self._nspin == 1:
-                        ret_evec[:, i, :] = evec[:, :]
-                    elif self._nspin == 2:
-                        ret_evec[:, i, :, :] = evec[:, :, :]
+            if chunk_size is None:
+                chunk_size = self._k_chunk_size()
+            k_arr = np.array(k_list, dtype=float)
+            # go over chunks of kpoints
+            for start in range(0, nkp, chunk_size):
+                stop = min(start + chunk_size, nkp)
+                ham = self.gen_ham_batch(k_arr[start:stop])
+                _solve_k_chunk(
+                    ham, self._norb, self._nspin, eig_vectors, herm_check,
+                    ret_eval, ret_evec, start, stop
+                )
             # return stuff
             if eig_vectors == False:
                 # indices of eval are [band,kpoint]
@@ -1205,6 +1472,28 @@ matrix."""
                 # indices of eval are [band] and of evec are [band,orbital,spin]
                 return (eval, evec)
 
+    def _solve_all_parallel(self, k_list, eig_vectors, chunk_size, herm_check, n_workers):
+        """Implementation of solve_all with a pool of n_workers processes.
+        Input k-vectors and output arrays live in shared memory, so only
+        their names and the (start,stop) ranges of k-points are sent to
+        the workers."""
+        k_arr = self._k_array(k_list)
+        if chunk_size is None:
+            # at least one chunk per worker
+            chunk_size = min(self._k_chunk_size(), -(-k_arr.shape[0] // n_workers))
+        n_workers = min(n_workers, -(-k_arr.shape[0] // chunk_size))
+        with _SolvePool(self, eig_vectors, herm_check, n_workers) as pool:
+            return pool.solve(k_arr, chunk_size=chunk_size)
+
+    def _k_chunk_size(self):
+        """Number of k-points solved together by solve_all, chosen so
+        that Bloch phases, Hamiltonians and eigenvectors of one chunk
+        fit into SOLVE_MEMORY_BUDGET bytes."""
+        nhop = len(self._hoppings) * (4 if self._nspin == 2 else 1)
+        # complex numbers needed per k-point
+        per_k = 16 * (nhop + 4 * self._nsta * self._nsta)
+        return max(1, int(SOLVE_MEMORY_BUDGET // per_k))
+
     def solve_one(self, k_point=None, eig_vectors=False):
         r"""
 
@@ -1229,6 +1518,100 @@ matrix."""
             # do the same as solve_all
             return self.solve_all(eig_vectors=eig_vectors)
 
+    def solve_window(self, k_list=None, e_center=0.0, n_bands=6, eig_vectors=False):
+        r"""
+        Solves for *n_bands* eigenvalues closest to the energy *e_center*
+        (and optionally corresponding eigenvectors) at each k-vector.
+        Hamiltonians are built as sparse matrices by
+        :func:`pythtb.tb_model.gen_ham_sparse` and diagonalized with the
+        shift-invert mode of ARPACK, so that the full spectrum of a
+        large model is never computed. If *n_bands* is too large for
+        ARPACK compared to the number of states, the dense solver is
+        used instead.
+
+        :param k_list: One-dimensional array of k-vectors, as in
+          :func:`pythtb.tb_model.solve_all`. Should not be given for a
+          model with zero-dimensional k-space.
+
+        :param e_center: Target energy around which eigenvalues are
+          computed.
+
+        :param n_bands: Number of eigenvalues computed at each k-vector.
+
+        :param eig_vectors: Optional boolean parameter, specifying
+          whether eigenvectors should be returned.
+
+        :returns:
+          * **eval** -- Array of eigenvalues in the format
+            eval[band,kpoint], sorted from smallest to largest at each
+            k-point. For zero-dimensional k-space the kpoint index is
+            dropped.
+
+          * **evec** -- Array of eigenvectors in the format
+            evec[band,kpoint,orbital,(spin)], as in
+            :func:`pythtb.tb_model.solve_all`. For zero-dimensional
+            k-space the kpoint index is dropped.
+
+        Example usage::
+
+          # ten states closest to zero energy of a large finite piece
+          (eval, evec) = flake.solve_window(e_center=0.0, n_bands=10, eig_vectors=True)
+          # edge states of a ribbon along a path
+          eval = ribbon.solve_window(k_path, e_center=0.0, n_bands=4)
+
+        """
+        if n_bands < 1 or n_bands > self._nsta:
+            raise Exception("\n\nWrong number of bands n_bands!")
+        if k_list is None:
+            if self._dim_k != 0:
+                raise Exception("\n\nHave to provide k-vectors!")
+            k_arr = np.zeros((1, 0), dtype=float)
+        else:
+            k_arr = self._k_array(k_list)
+        nkp = k_arr.shape[0]
+        ret_eval = np.zeros((n_bands, nkp), dtype=float)
+        if self._nspin == 1:
+            ret_evec = np.zeros((n_bands, nkp, self._norb), dtype=complex)
+        elif self._nspin == 2:
+            ret_evec = np.zeros((n_bands, nkp, self._norb, 2), dtype=complex)
+        hop_arrays = self._get_hop_arrays()
+        for ik in range(nkp):
+            if n_bands < self._nsta - 1:
+                ham = _sparse_ham_from_arrays(
+                    hop_arrays, self._site_energies, self._norb, self._nspin, k_arr[ik]
+                )
+                if eig_vectors == False:
+                    eval = sparse_linalg.eigsh(
+                        ham, k=n_bands, sigma=e_center, which="LM",
+                        return_eigenvectors=False
+                    )
+                else:
+                    (eval, eig) = sparse_linalg.eigsh(
+                        ham, k=n_bands, sigma=e_center, which="LM"
+                    )
+            else:
+                # too many bands for ARPACK, use dense solver
+                ham = _ham_from_arrays(
+                    hop_arrays, self._site_energies, self._norb, self._nspin,
+                    k_arr[ik : ik + 1]
+                ).reshape((self._nsta, self._nsta))
+                (eval, eig) = np.linalg.eigh(ham)
+                keep = np.argsort(np.abs(eval - e_center), kind="stable")[:n_bands]
+                (eval, eig) = (eval[keep], eig[:, keep])
+            # sort eigenvalues (and eigenvectors)
+            eval = np.array(eval.real, dtype=float)
+            args = eval.argsort()
+            ret_eval[:, ik] = eval[args]
+            if eig_vectors == True:
+                ret_evec[:, ik] = eig[:, args].T.reshape(ret_evec[:, ik].shape)
+        # drop kpoint index for zero-dimensional k-space
+        if k_list is None:
+            (ret_eval, ret_evec) = (ret_eval[:, 0], ret_evec[:, 0])
+        if eig_vectors == False:
+            return ret_eval
+        else:
+            return (ret_eval, ret_evec)
+
     def cut_piece(self, num, fin_dir, glue_edgs=False):
         r"""
         Constructs a (d-1)-dimensional tight-binding model out of a
@@ -1281,21 +1664,14 @@ matrix."""
         if num == 1 and glue_edgs == True:
             raise Exception("\n\nCan't have num==1 and glueing of the edges!")
 
-        # generate orbitals of a finite model
-        fin_orb = []
-        onsite = []  # store also onsite energies
-        for i in range(num):  # go over all cells in finite direction
-            for j in range(self._norb):  # go over all orbitals in one cell
-                # make a copy of j-th orbital
-                orb_tmp = np.copy(self._orb[j, :])
-                # change coordinate along finite direction
-                orb_tmp[fin_dir] += float(i)
-                # add to the list
-                fin_orb.append(orb_tmp)
-                # do the onsite energies at the same time
-                onsite.append(self._site_energies[j])
-        onsite = np.array(onsite)
-        fin_orb = np.array(fin_orb)
+        # generate orbitals of a finite model, going over all cells in
+        # finite direction and then over all orbitals in one cell
+        cell_of_orb = np.repeat(np.arange(num), self._norb)
+        fin_orb = np.tile(self._orb, (num, 1))
+        # change coordinate along finite direction
+        fin_orb[:, fin_dir] += cell_of_orb
+        # do the onsite energies at the same time
+        onsite = np.tile(self._site_energies, (num,) + (1,) * (self._site_energies.ndim - 1))
 
         # generate periodic directions of a finite model
         fin_per = copy.deepcopy(self._per)
@@ -1325,45 +1701,47 @@ matrix."""
         fin_model.set_onsite(onsite, mode="reset")
 
         # put all hopping terms
-        for c in range(num):  # go over all cells in finite direction
-            for h in range(len(self._hoppings)):  # go over all hoppings in one cell
-                # amplitude of the hop is the same
-                amp = self._hoppings[h][0]
-
-                # lattice vector of the hopping
-                ind_R = copy.deepcopy(self._hoppings[h][3])
-                jump_fin = ind_R[
-                    fin_dir
-                ]  # store by how many cells is the hopping in finite direction
-                if fin_model._dim_k != 0:
-                    ind_R[fin_dir] = 0  # one of the directions now becomes finite
-
-                # index of "from" and "to" hopping indices
-                hi = self._hoppings[h][1] + c * self._norb
-                #   have to compensate  for the fact that ind_R in finite direction
-                #   will not be used in the finite model
-                hj = self._hoppings[h][2] + (c + jump_fin) * self._norb
-
-                # decide whether this hopping should be added or not
-                to_add = True
-                # if edges are not glued then neglect all jumps that spill out
-                if glue_edgs == False:
-                    if hj < 0 or hj >= self._norb * num:
-                        to_add = False
-                # if edges are glued then do mod division to wrap up the hopping
-                else:
-                    hj = int(hj) % int(self._norb * num)
-
-                # add hopping to a finite model
-                if to_add == True:
-                    if fin_model._dim_k == 0:
-                        fin_model.set_hop(
-                            amp, hi, hj, mode="add", allow_conjugate_pair=True
-                        )
-                    else:
-                        fin_model.set_hop(
-                            amp, hi, hj, ind_R, mode="add", allow_conjugate_pair=True
-                        )
+        nhop = len(self._hoppings)
+        if nhop > 0:
+            amp = np.array([h[0] for h in self._hoppings])
+            hop_i = np.array([h[1] for h in self._hoppings], dtype=int)
+            hop_j = np.array([h[2] for h in self._hoppings], dtype=int)
+            ind_R = np.array([h[3] for h in self._hoppings], dtype=int)
+            ind_R = ind_R.reshape((nhop, self._dim_r))
+            # repeat all hoppings in all cells in finite direction,
+            # indices are [cell*nhop+hopping]
+            cell_of_hop = np.repeat(np.arange(num), nhop)
+            # store by how many cells is the hopping in finite direction
+            jump_fin = np.tile(ind_R[:, fin_dir], num)
+            # index of "from" and "to" hopping indices
+            hi = np.tile(hop_i, num) + cell_of_hop * self._norb
+            #   have to compensate  for the fact that ind_R in finite direction
+            #   will not be used in the finite model
+            hj = np.tile(hop_j, num) + (cell_of_hop + jump_fin) * self._norb
+            # if edges are not glued then neglect all jumps that spill out
+            if glue_edgs == False:
+                to_add = (hj >= 0) & (hj < self._norb * num)
+            # if edges are glued then do mod division to wrap up the hopping
+            else:
+                hj = hj % (self._norb * num)
+                to_add = np.ones(num * nhop, dtype=bool)
+            fin_amp = np.tile(amp, (num,) + (1,) * (amp.ndim - 1))[to_add]
+            # add hoppings to a finite model
+            if fin_model._dim_k == 0:
+                fin_model.set_hops(
+                    fin_amp, hi[to_add], hj[to_add], mode="add", allow_conjugate_pair=True
+                )
+            else:
+                fin_R = np.tile(ind_R, (num, 1))
+                fin_R[:, fin_dir] = 0  # one of the directions now becomes finite
+                fin_model.set_hops(
+                    fin_amp,
+                    hi[to_add],
+                    hj[to_add],
+                    fin_R[to_add],
+                    mode="add",
+                    allow_conjugate_pair=True,
+                )
 
         return fin_model
 
@@ -1409,6 +1787,7 @@ matrix."""
 
         # specify hopping terms from scratch
         red_tb._hoppings = []
+        red_tb._invalidate_hop_arrays()
         # set all hopping parameters for this value of value_k
         for h in range(len(self._hoppings)):
             hop = self._hoppings[h]
@@ -1540,77 +1919,49 @@ matrix."""
                 "\n\nSuper-cell lattice vectors need to form right handed system."
             )
 
-        # converts reduced vector in original lattice to reduced vector in super-cell lattice
+        # converts reduced vectors in original lattice to reduced vectors in super-cell lattice
         def to_red_sc(red_vec_orig):
             return np.linalg.solve(
                 np.array(use_sc_red_lat.T, dtype=float),
-                np.array(red_vec_orig, dtype=float),
-            )
+                np.array(red_vec_orig, dtype=float).T,
+            ).T
+
+        # integer vectors are handled exactly: reduced coordinates of
+        # vector v in super-cell lattice are (v @ sc_adj) / sc_det
+        sc_det = int(round(np.linalg.det(use_sc_red_lat)))
+        sc_adj = np.array(
+            np.round(np.linalg.inv(use_sc_red_lat) * sc_det), dtype=int
+        )
 
         # conservative estimate on range of search for super-cell vectors
         max_R = np.max(np.abs(use_sc_red_lat)) * self._dim_r
-
-        # candidates for super-cell vectors
-        # this is hard-coded and can be improved!
-        sc_cands = []
-        if self._dim_r == 1:
-            for i in range(-max_R, max_R + 1):
-                sc_cands.append(np.array([i]))
-        elif self._dim_r == 2:
-            for i in range(-max_R, max_R + 1):
-                for j in range(-max_R, max_R + 1):
-                    sc_cands.append(np.array([i, j]))
-        elif self._dim_r == 3:
-            for i in range(-max_R, max_R + 1):
-                for j in range(-max_R, max_R + 1):
-                    for k in range(-max_R, max_R + 1):
-                        sc_cands.append(np.array([i, j, k]))
-        elif self._dim_r == 4:
-            for i in range(-max_R, max_R + 1):
-                for j in range(-max_R, max_R + 1):
-                    for k in range(-max_R, max_R + 1):
-                        for l in range(-max_R, max_R + 1):
-                            sc_cands.append(np.array([i, j, k, l]))
-        else:
+        if self._dim_r > 4:
             raise Exception("\n\nWrong dimensionality of dim_r!")
-
-        # find all vectors inside super-cell
-        # store them here
-        sc_vec = []
-        eps_shift = (
-            np.sqrt(2.0) * 1.0e-8
-        )  # shift of the grid, so to avoid double counting
-        #
-        for vec in sc_cands:
-            # compute reduced coordinates of this candidate vector in the super-cell frame
-            tmp_red = to_red_sc(vec).tolist()
-            # check if in the interior
-            inside = True
-            for t in tmp_red:
-                if t <= -1.0 * eps_shift or t > 1.0 - eps_shift:
-                    inside = False
-            if inside == True:
-                sc_vec.append(np.array(vec))
+        # candidates for super-cell vectors, in the same order as nested
+        # loops over directions
+        sc_cands = np.indices([2 * max_R + 1] * self._dim_r).reshape((self._dim_r, -1)).T
+        sc_cands = sc_cands - max_R
+        # find all vectors inside super-cell, that is with reduced
+        # coordinates in the super-cell frame in the interval [0,1)
+        cand_red = np.dot(sc_cands, sc_adj)
+        inside = np.all((cand_red >= 0) & (cand_red < sc_det), axis=1)
+        sc_vec = [np.array(vec) for vec in sc_cands[inside]]
         # number of times unit cell is repeated in the super-cell
         num_sc = len(sc_vec)
-
         # check that found enough super-cell vectors
         if int(round(np.abs(np.linalg.det(use_sc_red_lat)))) != num_sc:
             raise Exception(
                 "\n\nSuper-cell generation failed! Wrong number of super-cell vectors found."
             )
+        sc_vec_arr = np.array(sc_vec, dtype=int).reshape((num_sc, self._dim_r))
 
         # cartesian vectors of the super lattice
         sc_cart_lat = np.dot(use_sc_red_lat, self._lat)
-
-        # orbitals of the super-cell tight-binding model
-        sc_orb = []
-        for cur_sc_vec in sc_vec:  # go over all super-cell vectors
-            for orb in self._orb:  # go over all orbitals
-                # shift orbital and compute coordinates in
-                # reduced coordinates of super-cell
-                sc_orb.append(to_red_sc(orb + cur_sc_vec))
-
+        # orbitals of the super-cell tight-binding model, going over all
+        # super-cell vectors and then over all orbitals
+        sc_orb = to_red_sc(
+            (sc_vec_arr[:, None, :] + self._orb[None, :, :]).reshape((-1, self._dim_r))
+        )
         # create super-cell tb_model object to be returned
         sc_tb = tb_model(
             self._dim_k,
@@ -1627,44 +1978,52 @@ matrix."""
         )
 
         # repeat onsite energies
-        for i in range(num_sc):
-            for j in range(self._norb):
-                sc_tb.set_onsite(self._site_energies[j], i * self._norb + j)
+        if self._nspin == 1:
+            sc_tb.set_onsite(np.tile(self._site_energies, num_sc))
+        elif self._nspin == 2:
+            sc_tb.set_onsite(np.tile(self._site_energies, (num_sc, 1, 1)))
 
         # set hopping terms
-        for c, cur_sc_vec in enumerate(sc_vec):  # go over all super-cell vectors
-            for h in range(
-                len(self._hoppings)
-            ):  # go over all hopping terms of the original model
-                # amplitude of the hop is the same
-                amp = self._hoppings[h][0]
-
-                # lattice vector of the hopping
-                ind_R = copy.deepcopy(self._hoppings[h][3])
-                # super-cell component of hopping lattice vector
-                # shift also by current super cell vector
-                sc_part = np.floor(to_red_sc(ind_R + cur_sc_vec))  # round down!
-                sc_part = np.array(sc_part, dtype=int)
-                # find remaining vector in the original reduced coordinates
-                orig_part = ind_R + cur_sc_vec - np.dot(sc_part, use_sc_red_lat)
-                # remaining vector must equal one of the super-cell vectors
-                pair_ind = None
-                for p, pair_sc_vec in enumerate(sc_vec):
-                    if False not in (pair_sc_vec == orig_part):
-                        if pair_ind != None:
-                            raise Exception("\n\nFound duplicate super cell vector!")
-                        pair_ind = p
-                if pair_ind == None:
-                    raise Exception("\n\nDid not find super cell vector!")
-
-                # index of "from" and "to" hopping indices
-                hi = self._hoppings[h][1] + c * self._norb
-                hj = self._hoppings[h][2] + pair_ind * self._norb
-
-                # add hopping term
-                sc_tb.set_hop(
-                    amp, hi, hj, sc_part, mode="add", allow_conjugate_pair=True
-                )
+        nhop = len(self._hoppings)
+        if nhop > 0:
+            amp = np.array([h[0] for h in self._hoppings])
+            hop_i = np.array([h[1] for h in self._hoppings], dtype=int)
+            hop_j = np.array([h[2] for h in self._hoppings], dtype=int)
+            ind_R = np.array([h[3] for h in self._hoppings], dtype=int)
+            ind_R = ind_R.reshape((nhop, self._dim_r))
+            # lattice vector of each hopping shifted by each super-cell
+            # vector, indices are [super-cell vector,hopping,direction]
+            shifted = ind_R[None, :, :] + sc_vec_arr[:, None, :]
+            shifted = shifted.reshape((num_sc * nhop, self._dim_r))
+            # super-cell component of hopping lattice vector (round down!)
+            sc_part = np.floor_divide(np.dot(shifted, sc_adj), sc_det)
+            # remaining vector in the original reduced coordinates
+            orig_part = shifted - np.dot(sc_part, use_sc_red_lat)
+            # remaining vector must equal one of the super-cell vectors,
+            # look it up by its encoded value
+            base = 2 * max_R + 1
+            weights = base ** np.arange(self._dim_r)
+            sc_keys = np.dot(sc_vec_arr + max_R, weights)
+            sc_order = np.argsort(sc_keys)
+            in_range = np.all(np.abs(orig_part) <= max_R, axis=1)
+            keys = np.dot(np.clip(orig_part, -max_R, max_R) + max_R, weights)
+            pos = np.minimum(np.searchsorted(sc_keys[sc_order], keys), num_sc - 1)
+            pair_ind = sc_order[pos]
+            if not np.all(in_range & (sc_keys[pair_ind] == keys)):
+                raise Exception("\n\nDid not find super cell vector!")
+            # index of "from" and "to" hopping indices
+            cur_ind = np.repeat(np.arange(num_sc), nhop)
+            hi = np.tile(hop_i, num_sc) + cur_ind * self._norb
+            hj = np.tile(hop_j, num_sc) + pair_ind * self._norb
+            # add all hopping terms at once
+            sc_tb.set_hops(
+                np.tile(amp, (num_sc,) + (1,) * (amp.ndim - 1)),
+                hi,
+                hj,
+                sc_part,
+                mode="add",
+                allow_conjugate_pair=True,
+            )
 
         # put orbitals to home cell if asked for
         if to_home == True:
@@ -1700,6 +2059,7 @@ matrix."""
                             self._hoppings[h][3] -= disp_vec
                         if self._hoppings[h][2] == i:
                             self._hoppings[h][3] += disp_vec
+        self._invalidate_hop_arrays()
 
     def remove_orb(self, to_remove):
         r"""
@@ -1777,6 +2137,7 @@ matrix."""
                         ret._hoppings[j][1] -= 1
                     if h[2] > orb_ind:
                         ret._hoppings[j][2] -= 1
+        ret._invalidate_hop_arrays()
         # return new model
         return ret
 
@@ -2354,6 +2715,22 @@ class wf_array(object):
     :param mesh_arr: Array giving a dimension of the grid of points in
       each reciprocal-space or parametric direction.
 
+    :param storage: Optional parameter, either "memory" (default) or
+      "memmap". With "memmap" wavefunctions are kept in a file and
+      accessed as a memory map, so that grids larger than the available
+      memory can be used. :func:`pythtb.wf_array.solve_on_grid`,
+      :func:`pythtb.wf_array.berry_flux` and the boundary conditions
+      then go over the grid in chunks of at most *WF_MEMORY_BUDGET*
+      bytes.
+
+    :param filename: Optional name of the file used with
+      storage="memmap", the content is stored in the .npy format.  If
+      the file already exists and contains an array of wavefunctions
+      of the right shape, it is reopened and its wavefunctions are used
+      without solving the model again.  By default an unnamed
+      temporary file is used, which is removed once the wf_array is
+      deleted.
+
     Example usage::
 
       # Construct wf_array capable of storing an 11x21 array of
@@ -2370,9 +2747,16 @@ class wf_array(object):
       # To access the eigenvectors from the same position
       print wf[3, 4]
 
+      # Keep a large grid in a file and reuse it later
+      wf = wf_array(tb, [41, 41, 41, 41], storage="memmap", filename="grid.npy")
+      wf.solve_on_grid([0.0, 0.0, 0.0, 0.0])
+      # later, with the same model
+      wf = wf_array(tb, [41, 41, 41, 41], storage="memmap", filename="grid.npy")
+      print wf.berry_flux([0, 1], dirs=[0, 1])
+
     """
 
-    def __init__(self, model, mesh_arr):
+    def __init__(self, model, mesh_arr, storage="memory", filename=None):
         # number of electronic states for each k-point
         self._nsta = model._nsta
         # number of spin components
@@ -2398,9 +2782,17 @@ class wf_array(object):
         if self._nspin == 2:
             wfs_dim = np.append(wfs_dim, self._nspin)
         # store wavefunctions here in the form _wfs[kx_index,ky_index, ... ,band,orb,spin]
-        self._wfs = np.zeros(wfs_dim, dtype=complex)
+        if storage == "memory":
+            if filename is not None:
+                raise Exception("\n\nFilename can only be used with storage='memmap'.")
+            self._wfs = np.zeros(wfs_dim, dtype=complex)
+        elif storage == "memmap":
+            self._wfs = _open_wfs_memmap(filename, tuple(int(x) for x in wfs_dim))
+        else:
+            raise Exception("\n\nWrong value of storage parameter")
+        self._storage = storage
 
-    def solve_on_grid(self, start_k):
+    def solve_on_grid(self, start_k, n_workers=None):
         r"""
 
         Solve a tight-binding model on a regular mesh of k-points covering
@@ -2413,6 +2805,10 @@ class wf_array(object):
 
         :param start_k: Origin of a regular grid of points in the reciprocal space.
 
+        :param n_workers: Optional number of worker processes used to
+          solve the model on the grid, see
+          :func:`pythtb.tb_model.solve_all`.
+
         :returns:
           * **gaps** -- returns minimal direct bandgap between n-th and n+1-th
               band on all the k-points in the mesh.  Note that in the case of band
@@ -2438,72 +2834,77 @@ class wf_array(object):
             gap_dim = np.copy(self._mesh_arr) - 1
             gap_dim = np.append(gap_dim, self._norb * self._nspin - 1)
             all_gaps = np.zeros(gap_dim, dtype=float)
+        if self._dim_arr not in [1, 2, 3, 4]:
+            raise Exception("\n\nWrong dimensionality!")
         #
-        if self._dim_arr == 1:
-            # don't need to go over the last point because that will be
-            # computed in the impose_pbc call
-            for i in range(self._mesh_arr[0] - 1):
-                # generate a kpoint
-                kpt = [start_k[0] + float(i) / float(self._mesh_arr[0] - 1)]
-                # solve at that point
-                (eval, evec) = self._model.solve_one(kpt, eig_vectors=True)
-                # store wavefunctions
-                self[i] = evec
+        # all points of the grid except the last point in each direction,
+        # which will be computed in the impose_pbc call
+        inner = self._mesh_arr - 1
+        nkp = int(np.prod(inner))
+        if n_workers is not None and n_workers > 1:
+            # worker processes split the whole grid among themselves
+            chunk_size = nkp
+        else:
+            chunk_size = self._model._k_chunk_size()
+        if self._storage == "memmap":
+            # write wavefunctions to the file in pieces
+            per_k = self._wfs[(0,) * self._dim_arr].nbytes
+            chunk_size = min(chunk_size, self._chunk_size(per_k))
+        start_k = np.array(start_k, dtype=float)
+        if n_workers is not None and n_workers > 1 and nkp > 0:
+            # worker processes are started once for all chunks
+            pool = _SolvePool(self._model, True, "all", n_workers)
+        else:
+            pool = None
+        try:
+            for start in range(0, nkp, chunk_size):
+                stop = min(start + chunk_size, nkp)
+                # grid indices [i,j,...] of these points, in the same order as
+                # nested loops over directions
+                idx = np.unravel_index(np.arange(start, stop), inner)
+                kpts = start_k[None, :] + np.array(idx, dtype=float).T / inner[None, :]
+                if pool is None:
+                    (eval, evec) = self._model.solve_all(kpts, eig_vectors=True)
+                else:
+                    (eval, evec) = pool.solve(kpts)
+                # store wavefunctions, evec[band,kpoint,...] goes to _wfs[i,j,...,band,...]
+                self._wfs[idx] = np.moveaxis(evec, 1, 0)
                 # store gaps
                 if all_gaps is not None:
-                    all_gaps[i, :] = eval[1:] - eval[:-1]
-            # impose boundary conditions
-            self.impose_pbc(0, self._model._per[0])
-        elif self._dim_arr == 2:
-            for i in range(self._mesh_arr[0] - 1):
-                for j in range(self._mesh_arr[1] - 1):
-                    kpt = [
-                        start_k[0] + float(i) / float(self._mesh_arr[0] - 1),
-                        start_k[1] + float(j) / float(self._mesh_arr[1] - 1),
-                    ]
-                    (eval, evec) = self._model.solve_one(kpt, eig_vectors=True)
-                    self[i, j] = evec
-                    if all_gaps is not None:
-                        all_gaps[i, j, :] = eval[1:] - eval[:-1]
-            for dir in range(2):
-                self.impose_pbc(dir, self._model._per[dir])
-        elif self._dim_arr == 3:
-            for i in range(self._mesh_arr[0] - 1):
-                for j in range(self._mesh_arr[1] - 1):
-                    for k in range(self._mesh_arr[2] - 1):
-                        kpt = [
-                            start_k[0] + float(i) / float(self._mesh_arr[0] - 1),
-                            start_k[1] + float(j) / float(self._mesh_arr[1] - 1),
-                            start_k[2] + float(k) / float(self._mesh_arr[2] - 1),
-                        ]
-                        (eval, evec) = self._model.solve_one(kpt, eig_vectors=True)
-                        self[i, j, k] = evec
-                        if all_gaps is not None:
-                            all_gaps[i, j, k, :] = eval[1:] - eval[:-1]
-            for dir in range(3):
-                self.impose_pbc(dir, self._model._per[dir])
-        elif self._dim_arr == 4:
-            for i in range(self._mesh_arr[0] - 1):
-                for j in range(self._mesh_arr[1] - 1):
-                    for k in range(self._mesh_arr[2] - 1):
-                        for l in range(self._mesh_arr[3] - 1):
-                            kpt = [
-                                start_k[0] + float(i) / float(self._mesh_arr[0] - 1),
-                                start_k[1] + float(j) / float(self._mesh_arr[1] - 1),
-                                start_k[2] + float(k) / float(self._mesh_arr[2] - 1),
-                                start_k[3] + float(l) / float(self._mesh_arr[3] - 1),
-                            ]
-                            (eval, evec) = self._model.solve_one(kpt, eig_vectors=True)
-                            self[i, j, k, l] = evec
-                            if all_gaps is not None:
-                                all_gaps[i, j, k, l, :] = eval[1:] - eval[:-1]
-            for dir in range(4):
-                self.impose_pbc(dir, self._model._per[dir])
-        else:
-            raise Exception("\n\nWrong dimensionality!")
+                    all_gaps[idx] = (eval[1:] - eval[:-1]).T
+        finally:
+            if pool is not None:
+                pool.close()
+        # impose boundary conditions
+        for dir in range(self._dim_arr):
+            self.impose_pbc(dir, self._model._per[dir])
+        if self._storage == "memmap":
+            self._wfs.flush()
 
         return all_gaps.min(axis=tuple(range(self._dim_arr)))
 
+    def _chunk_size(self, nbytes):
+        """Number of pieces of nbytes bytes each that fit into
+        WF_MEMORY_BUDGET bytes, at least one."""
+        return max(1, int(WF_MEMORY_BUDGET // max(1, nbytes)))
+
+    def _copy_face(self, mesh_dir, phase=None):
+        """Copies wavefunctions from the first to the last point along
+        mesh_dir, multiplying them with phase if given. Goes over the
+        face in chunks along another direction of the mesh."""
+        if mesh_dir not in range(self._dim_arr):
+            raise Exception("\n\nWrong value of mesh_dir.")
+        first = np.moveaxis(self._wfs, mesh_dir, 0)[0]
+        last = np.moveaxis(self._wfs, mesh_dir, 0)[-1]
+        # phase depends only on orbital and spin, which are the last indices
+        chunk_size = self._chunk_size(first[0].nbytes)
+        for start in range(0, first.shape[0], chunk_size):
+            sl = slice(start, start + chunk_size)
+            if phase is None:
+                last[sl] = first[sl]
+            else:
+                last[sl] = first[sl] * phase
+
     def __check_key(self, key):
         # do some checks for 1D
         if self._dim_arr == 1:
@@ -2601,16 +3002,7 @@ class wf_array(object):
 
         # Copy first eigenvector onto last one, multiplying by phase factors
         # We can use numpy broadcasting since the orbital index is last
-        if mesh_dir == 0:
-            self._wfs[-1, ...] = self._wfs[0, ...] * phase
-        elif mesh_dir == 1:
-            self._wfs[:, -1, ...] = self._wfs[:, 0, ...] * phase
-        elif mesh_dir == 2:
-            self._wfs[:, :, -1, ...] = self._wfs[:, :, 0, ...] * phase
-        elif mesh_dir == 3:
-            self._wfs[:, :, :, -1, ...] = self._wfs[:, :, :, 0, ...] * phase
-        else:
-            raise Exception("\n\nWrong value of mesh_dir.")
+        self._copy_face(mesh_dir, phase)
 
     def impose_loop(self, mesh_dir):
         r"""
@@ -2643,16 +3035,7 @@ class wf_array(object):
         """
 
         # Copy first eigenvector onto last one
-        if mesh_dir == 0:
-            self._wfs[-1, ...] = self._wfs[0, ...]
-        elif mesh_dir == 1:
-            self._wfs[:, -1, ...] = self._wfs[:, 0, ...]
-        elif mesh_dir == 2:
-            self._wfs[:, :, -1, ...] = self._wfs[:, :, 0, ...]
-        elif mesh_dir == 3:
-            self._wfs[:, :, :, -1, ...] = self._wfs[:, :, :, 0, ...]
-        else:
-            raise Exception("\n\nWrong value of mesh_dir.")
+        self._copy_face(mesh_dir)
 
     def berry_phase(self, occ, dir=None, contin=True, berry_evals=False):
         r"""
@@ -2820,12 +3203,10 @@ class wf_array(object):
                     ret = _one_phase_cont(ret, ret[0])
                 # 3D case
                 elif self._dim_arr == 3:
-                    for i in range(ret.shape[1]):
-                        if i == 0:
-                            clos = ret[0, 0]
-                        else:
-                            clos = ret[0, i - 1]
-                        ret[:, i] = _one_phase_cont(ret[:, i], clos)
+                    # first point on each line is close to first point on
+                    # the previous line, then each line is made continuous
+                    ret[0, :] = _one_phase_cont(ret[0, :], ret[0, 0])
+                    ret = _one_phase_cont(ret, ret[0, :])
                 elif self._dim_arr != 1:
                     raise Exception("\n\nWrong dimensionality!")
             # make eigenvalues continuous. This does not take care of band-character
@@ -2950,11 +3331,9 @@ class wf_array(object):
             ord[0] = dirs[0]
             ord[1] = dirs[1]
             plane_wfs = self._wfs.transpose(ord)
-            # take bands of choice
-            plane_wfs = plane_wfs[:, :, occ]
 
-            # compute fluxes
-            all_phases = _one_flux_plane(plane_wfs)
+            # compute fluxes for bands of choice
+            all_phases = self._plane_fluxes(plane_wfs, occ, nlead=0)
 
             # return either total flux or individual phase for each plaquete
             if individual_phases == False:
@@ -2986,44 +3365,13 @@ class wf_array(object):
                 ord[2] = ld[0]
                 ord[3] = ld[1]
 
-            # reorder wavefunctions
+            # reorder wavefunctions, remaining directions go first
             use_wfs = self._wfs.transpose(ord)
+            nlead = self._dim_arr - 2
+            use_wfs = np.moveaxis(use_wfs, (0, 1), (nlead, nlead + 1))
 
-            # loop over the the remaining direction
-            if self._dim_arr == 3:
-                slice_phases = np.zeros(
-                    (
-                        self._mesh_arr[ord[2]],
-                        self._mesh_arr[dirs[0]] - 1,
-                        self._mesh_arr[dirs[1]] - 1,
-                    ),
-                    dtype=float,
-                )
-                for i in range(self._mesh_arr[ord[2]]):
-                    # take a 2d slice
-                    plane_wfs = use_wfs[:, :, i]
-                    # take bands of choice
-                    plane_wfs = plane_wfs[:, :, occ]
-                    # compute fluxes on the slice
-                    slice_phases[i, :, :] = _one_flux_plane(plane_wfs)
-            elif self._dim_arr == 4:
-                slice_phases = np.zeros(
-                    (
-                        self._mesh_arr[ord[2]],
-                        self._mesh_arr[ord[3]],
-                        self._mesh_arr[dirs[0]] - 1,
-                        self._mesh_arr[dirs[1]] - 1,
-                    ),
-                    dtype=float,
-                )
-                for i in range(self._mesh_arr[ord[2]]):
-                    for j in range(self._mesh_arr[ord[3]]):
-                        # take a 2d slice
-                        plane_wfs = use_wfs[:, :, i, j]
-                        # take bands of choice
-                        plane_wfs = plane_wfs[:, :, occ]
-                        # compute fluxes on the slice
-                        slice_phases[i, j, :, :] = _one_flux_plane(plane_wfs)
+            # compute fluxes for bands of choice on all slices at once
+            slice_phases = self._plane_fluxes(use_wfs, occ, nlead=nlead)
 
             # return either total flux or individual phase for each plaquete
             if individual_phases == False:
@@ -3034,6 +3382,26 @@ class wf_array(object):
         else:
             raise Exception("\n\nWrong dimensionality!")
 
+    def _plane_fluxes(self, use_wfs, occ, nlead):
+        """Fluxes of bands occ on planes of wavefunctions use_wfs, which
+        has format [...,kpnt0,kpnt1,band,orbital,(spin)] with nlead
+        indices before kpnt0. Wavefunctions are read in chunks along
+        kpnt0 that fit into WF_MEMORY_BUDGET bytes."""
+        lead = (slice(None),) * nlead
+        nk0 = use_wfs.shape[nlead]
+        nk1 = use_wfs.shape[nlead + 1]
+        # bytes per point along kpnt0, with copies made while selecting
+        # bands and computing overlaps
+        chunk_size = max(1, self._chunk_size(3 * use_wfs[lead + (0,)].nbytes) - 1)
+        phases = np.zeros(use_wfs.shape[:nlead] + (nk0 - 1, nk1 - 1), dtype=float)
+        for start in range(0, nk0 - 1, chunk_size):
+            stop = min(start + chunk_size, nk0 - 1)
+            # plaquettes start..stop-1 need points start..stop
+            wfs = use_wfs[lead + (slice(start, stop + 1),)]
+            wfs = wfs[(slice(None),) * (nlead + 2) + (occ,)]
+            phases[lead + (slice(start, stop),)] = _flux_planes(wfs, nlead=nlead)
+        return phases
+
     def berry_curv(self, occ, individual_phases=False):
         r"""
 
@@ -3121,6 +3489,249 @@ def _nicefy_eig(eval, eig=None):
     return eval
 
 
+def _ham_from_arrays(hop_arrays, site_energies, norb, nspin, k_arr):
+    """Builds Hamiltonians ham[kpoint,...] of a model at k-vectors
+    k_arr[kpoint,:] from its compiled hoppings (as returned by
+    tb_model._get_hop_arrays). Used by tb_model.gen_ham_batch and by
+    the workers of the parallel solver."""
+    nk = k_arr.shape[0]
+    (amp, hop_i, hop_j, rv, scatter) = hop_arrays
+    nhop = len(hop_i)
+    # phases of all hoppings at all k-points, indices are [kpoint,hopping]
+    phase = np.exp((2.0j) * np.pi * np.dot(k_arr, rv.T))
+    if nspin == 1:
+        vals = phase * amp[None, :]
+        ham = scatter.dot(vals.T).T.reshape((nk, norb, norb))
+        # add conjugate of each hopping
+        ham = ham + ham.conj().transpose((0, 2, 1))
+        ham[:, np.arange(norb), np.arange(norb)] += site_energies[None, :]
+    elif nspin == 2:
+        vals = phase.T[:, :, None, None] * amp[:, None, :, :]
+        ham = scatter.dot(vals.reshape((nhop, nk * 4)))
+        ham = ham.reshape((norb, norb, nk, 2, 2)).transpose((2, 0, 3, 1, 4))
+        # add conjugate of each hopping
+        ham = ham + ham.conj().transpose((0, 3, 4, 1, 2))
+        for i in range(norb):
+            ham[:, i, :, i, :] += site_energies[i][None, :, :]
+    return ham
+
+
+def _sparse_ham_from_arrays(hop_arrays, site_energies, norb, nspin, k_vec):
+    """Builds the Hamiltonian of a model at a single k-vector k_vec as a
+    sparse CSR matrix of shape (nsta,nsta) from its compiled hoppings."""
+    (amp, hop_i, hop_j, rv) = hop_arrays[:4]
+    phase = np.exp((2.0j) * np.pi * np.dot(rv, k_vec))
+    onsite = np.arange(norb)
+    if nspin == 1:
+        vals = amp * phase
+        rows = np.concatenate((hop_i, hop_j, onsite))
+        cols = np.concatenate((hop_j, hop_i, onsite))
+        data = np.concatenate((vals, vals.conj(), np.asarray(site_energies, dtype=complex)))
+    elif nspin == 2:
+        # element [s,t] of 2x2 block of (i,j) goes to row 2*i+s, column 2*j+t
+        s_idx = np.repeat(np.arange(2), 2)
+        t_idx = np.tile(np.arange(2), 2)
+        vals = (amp * phase[:, None, None]).reshape(-1)
+        hop_rows = (2 * hop_i[:, None] + s_idx[None, :]).reshape(-1)
+        hop_cols = (2 * hop_j[:, None] + t_idx[None, :]).reshape(-1)
+        on_rows = (2 * onsite[:, None] + s_idx[None, :]).reshape(-1)
+        on_cols = (2 * onsite[:, None] + t_idx[None, :]).reshape(-1)
+        rows = np.concatenate((hop_rows, hop_cols, on_rows))
+        cols = np.concatenate((hop_cols, hop_rows, on_cols))
+        data = np.concatenate(
+            (vals, vals.conj(), np.asarray(site_energies, dtype=complex).reshape(-1))
+        )
+    nsta = norb * nspin
+    return sparse.coo_matrix((data, (rows, cols)), shape=(nsta, nsta)).tocsr()
+
+
+def _solve_k_chunk(ham, norb, nspin, eig_vectors, herm_check, ret_eval, ret_evec, start, stop):
+    """Diagonalizes a stack of Hamiltonians ham[kpoint,...] of k-points
+    start..stop-1 and writes sorted eigenvalues into ret_eval[band,kpoint]
+    and (if eig_vectors) eigenvectors into ret_evec[band,kpoint,orbital,(spin)]."""
+    nsta = norb * nspin
+    ham = ham.reshape((stop - start, nsta, nsta))
+    # check that matrices are hermitian
+    if herm_check == "all":
+        to_check = ham
+    elif herm_check == "sample":
+        to_check = ham[:1]
+    else:
+        to_check = ham[:0]
+    if to_check.size > 0:
+        if np.max(np.abs(to_check - to_check.conj().transpose((0, 2, 1)))) > 1.0e-9:
+            raise Exception("\n\nHamiltonian matrix is not hermitian?!")
+    # solve whole stack
+    if eig_vectors == False:
+        eval = np.linalg.eigvalsh(ham)
+    else:
+        (eval, eig) = np.linalg.eigh(ham)
+    # sort eigenvalues (and eigenvectors) as in _nicefy_eig
+    eval = np.array(eval.real, dtype=float)
+    args = eval.argsort(axis=1)
+    ret_eval[:, start:stop] = np.take_along_axis(eval, args, axis=1).T
+    if eig_vectors == True:
+        # eig[k,:,n] is eigenvector for n-th eigenvalue,
+        # store it as evec[n,k,:]
+        eig = np.take_along_axis(eig, args[:, None, :], axis=2)
+        eig = eig.transpose((2, 0, 1))
+        ret_evec[:, start:stop] = eig.reshape(ret_evec[:, start:stop].shape)
+
+
+# environment variables read by common BLAS libraries when loaded
+_BLAS_THREAD_VARS = (
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+)
+
+# data of a worker process of _SolvePool
+_SOLVE_WORKER = {}
+
+
+@contextlib.contextmanager
+def _single_blas_thread():
+    """Sets BLAS thread counts to one while worker processes are started,
+    so that n_workers processes do not oversubscribe the cores."""
+    saved = {var: os.environ.get(var) for var in _BLAS_THREAD_VARS}
+    try:
+        for var in _BLAS_THREAD_VARS:
+            os.environ[var] = "1"
+        yield
+    finally:
+        for (var, val) in saved.items():
+            if val is None:
+                os.environ.pop(var, None)
+            else:
+                os.environ[var] = val
+
+
+def _init_solve_worker(hop_arrays, site_energies, norb, nspin, eig_vectors, herm_check):
+    """Initializer of a worker process, receives compiled hoppings once."""
+    try:
+        from threadpoolctl import threadpool_limits
+
+        _SOLVE_WORKER["limits"] = threadpool_limits(limits=1)
+    except ImportError:
+        pass
+    _SOLVE_WORKER.update(
+        hop_arrays=hop_arrays,
+        site_energies=site_energies,
+        norb=norb,
+        nspin=nspin,
+        eig_vectors=eig_vectors,
+        herm_check=herm_check,
+    )
+
+
+def _solve_worker_task(task):
+    """Solves k-points task[1]..task[2]-1 inside a worker process, task[0]
+    describes shared memory with k-vectors and results."""
+    (buffers, start, stop) = task
+    w = _SOLVE_WORKER
+    shms = [shared_memory.SharedMemory(name=name) for (name, shape, dtype) in buffers]
+    views = [
+        np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        for (shm, (name, shape, dtype)) in zip(shms, buffers)
+    ]
+    if len(views) == 2:
+        views.append(None)
+    try:
+        ham = _ham_from_arrays(
+            w["hop_arrays"], w["site_energies"], w["norb"], w["nspin"],
+            views[0][start:stop]
+        )
+        _solve_k_chunk(
+            ham, w["norb"], w["nspin"], w["eig_vectors"], w["herm_check"],
+            views[1], views[2], start, stop
+        )
+    finally:
+        # views have to be released before shared memory is closed
+        del views[:]
+        for shm in shms:
+            shm.close()
+    return stop - start
+
+
+class _SolvePool(object):
+    """Pool of worker processes solving one model, see
+    tb_model.solve_all. Workers are started once and can be reused for
+    several lists of k-vectors, for example for chunks of a large grid."""
+
+    def __init__(self, model, eig_vectors, herm_check, n_workers):
+        self._nsta = model._nsta
+        self._norb = model._norb
+        self._nspin = model._nspin
+        self._k_chunk = model._k_chunk_size()
+        self._eig_vectors = eig_vectors
+        self._n_workers = n_workers
+        ctx = multiprocessing.get_context("spawn")
+        # workers read thread counts when they import numpy
+        with _single_blas_thread():
+            self._pool = ctx.Pool(
+                n_workers,
+                initializer=_init_solve_worker,
+                initargs=(
+                    model._get_hop_arrays(), model._site_energies, model._norb,
+                    model._nspin, eig_vectors, herm_check
+                ),
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._pool.terminate()
+        self._pool.join()
+
+    def solve(self, k_arr, chunk_size=None):
+        """Same as tb_model.solve_all for array of k-vectors k_arr[kpoint,:]."""
+        nkp = k_arr.shape[0]
+        if chunk_size is None:
+            # at least one chunk per worker
+            chunk_size = min(self._k_chunk, -(-nkp // self._n_workers))
+        if self._nspin == 1:
+            evec_shape = (self._nsta, nkp, self._norb)
+        elif self._nspin == 2:
+            evec_shape = (self._nsta, nkp, self._norb, 2)
+        specs = [(k_arr.shape, float), ((self._nsta, nkp), float)]
+        if self._eig_vectors == True:
+            specs.append((evec_shape, complex))
+        shms = []
+        views = []
+        try:
+            for (shape, dtype) in specs:
+                nbytes = max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+                shm = shared_memory.SharedMemory(create=True, size=nbytes)
+                shms.append(shm)
+                views.append(np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+            views[0][...] = k_arr
+            buffers = [(shm.name, shape, dtype) for (shm, (shape, dtype)) in zip(shms, specs)]
+            tasks = [
+                (buffers, start, min(start + chunk_size, nkp))
+                for start in range(0, nkp, chunk_size)
+            ]
+            self._pool.map(_solve_worker_task, tasks, chunksize=1)
+            ret_eval = np.array(views[1])
+            if self._eig_vectors == True:
+                ret_evec = np.array(views[2])
+        finally:
+            # views have to be released before shared memory is closed
+            del views[:]
+            for shm in shms:
+                shm.close()
+                shm.unlink()
+        if self._eig_vectors == False:
+            return ret_eval
+        else:
+            return (ret_eval, ret_evec)
+
+
 # for nice justified printout
 def _nice_float(x, just, rnd):
     return str(round(x, rnd)).rjust(just)
@@ -3157,33 +3768,22 @@ def _one_berry_loop(wf, berry_evals=False):
     links only!  If berry_evals is True then will compute phases for
     individual states, these corresponds to 1d hybrid Wannier
     function centers. Otherwise just return one number, Berry phase."""
-    # number of occupied states
-    nocc = wf.shape[1]
-    # temporary matrices
-    prd = np.identity(nocc, dtype=complex)
-    ovr = np.zeros([nocc, nocc], dtype=complex)
-    # go over all pairs of k-points, assuming that last point is overcounted!
-    for i in range(wf.shape[0] - 1):
-        # generate overlap matrix, go over all bands
-        for j in range(nocc):
-            for k in range(nocc):
-                ovr[j, k] = _wf_dpr(wf[i, j, :], wf[i + 1, k, :])
-        # only find Berry phase
-        if berry_evals == False:
-            # multiply overlap matrices
-            prd = np.dot(prd, ovr)
-        # also find phases of individual eigenvalues
-        else:
-            # cleanup matrices with SVD then take product
-            matU, sing, matV = np.linalg.svd(ovr)
-            prd = np.dot(prd, np.dot(matU, matV))
-    # calculate Berry phase
+    # overlap matrices of all links at once, ovr[i,j,k] is the dot
+    # product of wf[i,j] and wf[i+1,k], assuming that last point is overcounted!
+    # only find Berry phase
     if berry_evals == False:
-        det = np.linalg.det(prd)
-        pha = (-1.0) * np.angle(det)
+        # determinant of product of overlap matrices is product of
+        # their determinants, use only their phases to avoid underflow
+        det = _link_phases(wf[:-1], wf[1:], nlead=1)
+        pha = (-1.0) * np.angle(np.prod(det))
         return pha
-    # calculate phases of all eigenvalues
+    # also find phases of individual eigenvalues
     else:
+        # cleanup matrices with SVD then take product
+        ovr = _link_overlaps(wf[:-1], wf[1:], nlead=1)
+        matU, sing, matV = np.linalg.svd(ovr)
+        prd = _ordered_product(np.matmul(matU, matV))
+        # calculate phases of all eigenvalues
         evals = np.linalg.eigvals(prd)
         eval_pha = (-1.0) * np.angle(evals)
         # sort these numbers as well
@@ -3191,59 +3791,126 @@ def _one_berry_loop(wf, berry_evals=False):
         return eval_pha
 
 
+def _link_overlaps(wf1, wf2, nlead=1):
+    """Overlap matrices between states at two sets of points. wf1 and
+    wf2 have format [...,band,orbital,(spin)] with nlead indices before
+    band index, result has format [...,band1,band2] and contains dot
+    products of wf1[...,band1,:] and wf2[...,band2,:]."""
+    shape = wf1.shape[: nlead + 1] + (-1,)
+    wf1 = wf1.reshape(shape)
+    wf2 = wf2.reshape(wf2.shape[: nlead + 1] + (-1,))
+    return np.matmul(wf1.conj(), np.swapaxes(wf2, -1, -2))
+
+
+def _ordered_product(mats):
+    """Product mats[0] @ mats[1] @ ... of a stack of matrices, computed
+    by multiplying neighbouring pairs with batched matmul."""
+    if mats.shape[0] == 0:
+        return np.identity(mats.shape[-1], dtype=complex)
+    while mats.shape[0] > 1:
+        npair = mats.shape[0] // 2
+        prd = np.matmul(mats[0 : 2 * npair : 2], mats[1 : 2 * npair : 2])
+        if mats.shape[0] % 2 == 1:
+            prd = np.concatenate((prd, mats[-1:]), axis=0)
+        mats = prd
+    return mats[0]
+
+
+def _open_wfs_memmap(filename, shape):
+    """Memory map of complex array of wavefunctions with a given shape.
+    Without filename an unnamed temporary file is used. An existing file
+    is reopened with its content if it contains an array of that shape,
+    otherwise a new zero-filled .npy file is created."""
+    if filename is None:
+        # unnamed file, removed once the memory map is released
+        return np.memmap(
+            tempfile.TemporaryFile(), dtype=complex, mode="w+", shape=shape
+        )
+    if os.path.exists(filename):
+        wfs = np.lib.format.open_memmap(filename, mode="r+")
+        if wfs.shape != shape or wfs.dtype != np.dtype(complex):
+            raise Exception(
+                "\n\nFile "
+                + str(filename)
+                + " contains wavefunctions of shape "
+                + str(wfs.shape)
+                + " instead of "
+                + str(shape)
+                + "!"
+            )
+        return wfs
+    return np.lib.format.open_memmap(filename, mode="w+", dtype=complex, shape=shape)
+
+
 def _one_flux_plane(wfs2d):
     "Compute fluxes on a two-dimensional plane of states."
-    # size of the mesh
-    nk0 = wfs2d.shape[0]
-    nk1 = wfs2d.shape[1]
-    # number of bands (will compute flux of all bands taken together)
-    nbnd = wfs2d.shape[2]
-
-    # here store flux through each plaquette of the mesh
-    all_phases = np.zeros((nk0 - 1, nk1 - 1), dtype=float)
-
-    # go over all plaquettes
-    for i in range(nk0 - 1):
-        for j in range(nk1 - 1):
-            # generate a small loop made out of four pieces
-            wf_use = []
-            wf_use.append(wfs2d[i, j])
-            wf_use.append(wfs2d[i + 1, j])
-            wf_use.append(wfs2d[i + 1, j + 1])
-            wf_use.append(wfs2d[i, j + 1])
-            wf_use.append(wfs2d[i, j])
-            wf_use = np.array(wf_use, dtype=complex)
-            # calculate phase around one plaquette
-            all_phases[i, j] = _one_berry_loop(wf_use)
-
-    return all_phases
+    return _flux_planes(wfs2d, nlead=0)
+
+
+def _flux_planes(wfs, nlead=0):
+    """Compute fluxes on a stack of two-dimensional planes of states.
+    wfs has format [...,kpnt0,kpnt1,band,orbital,(spin)] with nlead
+    indices before the two k-point indices. Link variables (determinants
+    of overlap matrices) along both directions are computed only once
+    and combined into plaquette phases, as in Fukui, Hatsugai, and
+    Suzuki, J. Phys. Soc. Jpn. 74, 1674 (2005). Result has format
+    [...,kpnt0-1,kpnt1-1]."""
+    lead = (slice(None),) * nlead
+    # phases of link variables along first and second direction
+    u0 = _link_phases(
+        wfs[lead + (slice(None, -1),)], wfs[lead + (slice(1, None),)], nlead + 2
+    )
+    u1 = _link_phases(
+        wfs[lead + (slice(None), slice(None, -1))],
+        wfs[lead + (slice(None), slice(1, None))],
+        nlead + 2,
+    )
+    # go around plaquette [i,j] -> [i+1,j] -> [i+1,j+1] -> [i,j+1] -> [i,j]
+    loop = (
+        u0[..., :, :-1]
+        * u1[..., 1:, :]
+        * np.conj(u0[..., :, 1:])
+        * np.conj(u1[..., :-1, :])
+    )
+    return (-1.0) * np.angle(loop)
+
+
+def _link_phases(wf1, wf2, nlead):
+    """Phases of determinants of overlap matrices between wf1 and wf2,
+    set to zero where the determinant vanishes."""
+    det = np.linalg.det(_link_overlaps(wf1, wf2, nlead=nlead))
+    mod = np.abs(det)
+    return np.where(mod > 0.0, det / np.where(mod > 0.0, mod, 1.0), 0.0)
 
 
 def no_2pi(x, clos):
     "Make x as close to clos by adding or removing 2pi"
-    while abs(clos - x) > np.pi:
-        if clos - x > np.pi:
-            x += 2.0 * np.pi
-        elif clos - x < -1.0 * np.pi:
-            x -= 2.0 * np.pi
-    return x
+    return x + 2.0 * np.pi * _num_2pi(clos - x)
+
+
+def _num_2pi(dist):
+    """Smallest number of 2pi (in absolute value) that needs to be added
+    to a phase so that it is not further than pi from a phase that is
+    larger by dist."""
+    dist = np.asarray(dist, dtype=float)
+    return np.where(
+        dist > 0.0,
+        np.ceil((dist - np.pi) / (2.0 * np.pi)),
+        np.floor((dist + np.pi) / (2.0 * np.pi)),
+    )
 
 
 def _one_phase_cont(pha, clos):
     """Reads in 1d array of numbers *pha* and makes sure that they are
     continuous, i.e., that there are no jumps of 2pi. First number is
-    made as close to *clos* as possible."""
-    ret = np.copy(pha)
-    # go through entire list and "iron out" 2pi jumps
-    for i in range(len(ret)):
-        # which number to compare to
-        if i == 0:
-            cmpr = clos
-        else:
-            cmpr = ret[i - 1]
-        # make sure there are no 2pi jumps
-        ret[i] = no_2pi(ret[i], cmpr)
-    return ret
+    made as close to *clos* as possible. If *pha* has more than one
+    index, this is done along the first index, and *clos* has the
+    shape of the remaining indices."""
+    pha = np.asarray(pha, dtype=float)
+    # number to compare each number to
+    cmpr = np.concatenate((np.asarray(clos, dtype=float)[None], pha), axis=0)[:-1]
+    # "iron out" 2pi jumps, each jump is carried over to the rest of the list
+    return pha + 2.0 * np.pi * np.cumsum(_num_2pi(cmpr - pha), axis=0)
 
 
 def _array_phases_cont(arr_pha, clos):
@@ -3251,35 +3918,23 @@ def _array_phases_cont(arr_pha, clos):
     are continuous along first index, i.e., that there are no jumps of
     2pi. First array of phasese is made as close to *clos* as
     possible."""
-    ret = np.zeros_like(arr_pha)
-    # go over all points
+    arr_pha = np.asarray(arr_pha, dtype=float)
+    # points on unit circle, each array is compared to the previous one
+    pnt = np.exp(1.0j * arr_pha)
+    cmpr = np.concatenate((np.exp(1.0j * np.asarray(clos))[None, :], pnt[:-1]), axis=0)
+    # distances between all pairs of phases
+    dist = np.abs(cmpr[:, :, None] - pnt[:, None, :])
+    # order of phases in arr_pha[i,:] matching previous (ordered) phases
+    order = np.zeros(arr_pha.shape, dtype=int)
+    prev = np.arange(arr_pha.shape[1])
     for i in range(arr_pha.shape[0]):
-        # which phases to compare to
-        if i == 0:
-            cmpr = clos
-        else:
-            cmpr = ret[i - 1, :]
-        # remember which indices are still available to be matched
-        avail = list(range(arr_pha.shape[1]))
-        # go over all phases in cmpr[:]
-        for j in range(cmpr.shape[0]):
-            # minimal distance between pairs
-            min_dist = 1.0e10
-            # closest index
-            best_k = None
-            # go over each phase in arr_pha[i,:]
-            for k in avail:
-                cur_dist = np.abs(np.exp(1.0j * cmpr[j]) - np.exp(1.0j * arr_pha[i, k]))
-                if cur_dist <= min_dist:
-                    min_dist = cur_dist
-                    best_k = k
-            # remove this index from being possible pair later
-            avail.pop(avail.index(best_k))
-            # store phase in correct place
-            ret[i, j] = arr_pha[i, best_k]
-            # make sure there are no 2pi jumps
-            ret[i, j] = no_2pi(ret[i, j], cmpr[j])
-    return ret
+        # pairs with smallest total distance
+        (row, col) = linear_sum_assignment(dist[i])
+        prev = col[prev]
+        order[i] = prev
+    ret = np.take_along_axis(arr_pha, order, axis=1)
+    # make sure there are no 2pi jumps
+    return _one_phase_cont(ret, clos)
 
 
 class w90(object):
@@ -3391,6 +4046,21 @@ class w90(object):
     :param prefix: This is the prefix used by Wannier90 code.
         Typically the input to the Wannier90 code is name *prefix*.win.
 
+    :param use_cache: Optional parameter, default is *True*. Parsed
+        content of *prefix*\_hr.dat is stored next to it in the file
+        *prefix*\_hr.dat.npz together with size and modification time
+        of *prefix*\_hr.dat. Later instances read the Hamiltonian from
+        this file as a memory map, as long as *prefix*\_hr.dat has not
+        changed. If the folder is not writable no cache is stored.
+
+    :param storage: Optional parameter, either "memory" (default) or
+        "memmap". With "memmap" the R-blocks of the Hamiltonian are
+        written while parsing *prefix*\_hr.dat into a temporary file
+        (or directly into the cache) and accessed as a memory map. In
+        both cases :func:`pythtb.w90.model`, :func:`pythtb.w90.dist_hop`
+        and :func:`pythtb.w90.shells` go over R-blocks in chunks that
+        fit into *W90_MEMORY_BUDGET* bytes.
+
     Initially this function will read in the entire Wannier90 output.
     To create :class:`pythtb.tb_model` object user needs to call
     :func:`pythtb.w90.model`.
@@ -3403,7 +4073,7 @@ class w90(object):
 
     """
 
-    def __init__(self, path, prefix):
+    def __init__(self, path, prefix, use_cache=True, storage="memory"):
         # store path and prefix
         self.path = path
         self.prefix = prefix
@@ -3416,71 +4086,63 @@ class w90(object):
         self.lat, self.red_cen = self.read_geom(geom)
 
         # read in hamiltonian matrix, in eV
-        f = open(self.path + "/" + self.prefix + "_hr.dat", "r")
-        ln = f.readlines()
-        f.close()
-        #
-        # get number of wannier functions
-        self.num_wan = int(ln[1])
-        # get number of Wigner-Seitz points
-        num_ws = int(ln[2])
-        # get degenereacies of Wigner-Seitz points
-        deg_ws = []
-        for j in range(3, len(ln)):
-            sp = ln[j].split()
-            for s in sp:
-                deg_ws.append(int(s))
-            if len(deg_ws) == num_ws:
-                last_j = j
-                break
-            if len(deg_ws) > num_ws:
-                raise Exception("Too many degeneracies for WS points!")
-        deg_ws = np.array(deg_ws, dtype=int)
-        # now read in matrix elements
         # Convention used in w90 is to write out:
         # R1, R2, R3, i, j, ham_r(i,j,R)
         # where ham_r(i,j,R) corresponds to matrix element < i | H | j+R >
-        self.ham_r = {}  # format is ham_r[(R1,R2,R3)]["h"][i,j] for < i | H | j+R >
-        ind_R = 0  # which R vector in line is this?
-        for j in range(last_j + 1, len(ln)):
-            sp = ln[j].split()
-            # get reduced lattice vector components
-            ham_R1 = int(sp[0])
-            ham_R2 = int(sp[1])
-            ham_R3 = int(sp[2])
-            # get Wannier indices
-            ham_i = int(sp[3]) - 1
-            ham_j = int(sp[4]) - 1
-            # get matrix element
-            ham_val = float(sp[5]) + 1.0j * float(sp[6])
-            # store stuff, for each R store hamiltonian and degeneracy
-            ham_key = (ham_R1, ham_R2, ham_R3)
-            if (ham_key in self.ham_r) == False:
-                self.ham_r[ham_key] = {
-                    "h": np.zeros((self.num_wan, self.num_wan), dtype=complex),
-                    "deg": deg_ws[ind_R],
-                }
-                ind_R += 1
-            self.ham_r[ham_key]["h"][ham_i, ham_j] = ham_val
+        if storage not in ["memory", "memmap"]:
+            raise Exception("\n\nWrong value of storage parameter")
+        (self.num_wan, self._hr_R, self._hr_deg, self._hr_ham) = _load_hr(
+            self.path + "/" + self.prefix + "_hr.dat", use_cache=use_cache, storage=storage
+        )
+        # format is ham_r[(R1,R2,R3)]["h"][i,j] for < i | H | j+R >,
+        # blocks are views into one array _hr_ham[iR,i,j] ordered as in the file
+        self.ham_r = {}
+        # position of each R in _hr_ham
+        self._R_index = {}
+        for n in range(self._hr_R.shape[0]):
+            key = tuple(int(x) for x in self._hr_R[n])
+            self._R_index[key] = n
+            self.ham_r[key] = {"h": self._hr_ham[n], "deg": int(self._hr_deg[n])}
 
         # check if for every non-zero R there is also -R
         for R in self.ham_r:
-            if not (R[0] == 0 and R[1] == 0 and R[2] == 0):
-                found_pair = False
-                for P in self.ham_r:
-                    if not (R[0] == 0 and R[1] == 0 and R[2] == 0):
-                        # check if they are opposite
-                        if R[0] == -P[0] and R[1] == -P[1] and R[2] == -P[2]:
-                            if found_pair == True:
-                                raise Exception("Found duplicate negative R!")
-                            found_pair = True
-                if found_pair == False:
-                    raise Exception("Did not find negative R for R = " + R + "!")
+            if R != (0, 0, 0) and (-R[0], -R[1], -R[2]) not in self.ham_r:
+                raise Exception("Did not find negative R for R = " + str(R) + "!")
 
         self.xyz_cen = _red_to_cart(
             (self.lat[0], self.lat[1], self.lat[2]), self.red_cen
         )
 
+    def _R_position(self, R):
+        """Position of lattice vector R in the array of R-blocks."""
+        key = tuple(int(x) for x in R)
+        if key not in self._R_index:
+            raise Exception("Did not find R = " + str(key) + "!")
+        return self._R_index[key]
+
+    def _R_chunks(self, R_pos=None):
+        """Splits positions R_pos of R-blocks (by default all of them)
+        into chunks whose work arrays fit into W90_MEMORY_BUDGET bytes."""
+        if R_pos is None:
+            R_pos = np.arange(len(self._R_index))
+        # bytes needed per R-block: block, its copy, distance vectors,
+        # distances and masks
+        per_R = 80 * self.num_wan * self.num_wan
+        chunk_size = max(1, int(W90_MEMORY_BUDGET // per_R))
+        for start in range(0, len(R_pos), chunk_size):
+            yield R_pos[start : start + chunk_size]
+
+    def _R_distances(self, R):
+        """Distances between Wannier function centers i and j+R, for
+        lattice vectors R[iR,:], indices are [iR,i,j]."""
+        vecR = np.dot(R, self.lat)
+        dist_vec = (
+            -self.xyz_cen[None, :, None, :]
+            + self.xyz_cen[None, None, :, :]
+            + vecR[:, None, None, :]
+        )
+        return np.sqrt(np.sum(dist_vec * dist_vec, axis=3))
+
     def read_geom(self, wan90_wout):
         rf = open(wan90_wout, "r")
         lines = rf.readlines()
@@ -3579,73 +4241,41 @@ class w90(object):
         tb._assume_position_operator_diagonal = False
 
         # add onsite energies
-        onsite = np.zeros(self.num_wan, dtype=float)
-        for i in range(self.num_wan):
-            tmp_ham = self.ham_r[(0, 0, 0)]["h"][i, i] / float(
-                self.ham_r[(0, 0, 0)]["deg"]
-            )
-            onsite[i] = tmp_ham.real
-            if np.abs(tmp_ham.imag) > 1.0e-9:
-                raise Exception("Onsite terms should be real!")
-        tb.set_onsite(onsite - zero_energy)
-
-        # add hopping terms
-        for R in self.ham_r:
-            # avoid double counting
-            use_this_R = True
-            # avoid onsite terms
-            if R[0] == 0 and R[1] == 0 and R[2] == 0:
-                avoid_diagonal = True
-            else:
-                avoid_diagonal = False
-                # avoid taking both R and -R
-                if R[0] != 0:
-                    if R[0] < 0:
-                        use_this_R = False
-                else:
-                    if R[1] != 0:
-                        if R[1] < 0:
-                            use_this_R = False
-                    else:
-                        if R[2] < 0:
-                            use_this_R = False
-            # get R vector
-            vecR = _red_to_cart((self.lat[0], self.lat[1], self.lat[2]), [R])[0]
-            # scan through unique R
-            if use_this_R == True:
-                for i in range(self.num_wan):
-                    vec_i = self.xyz_cen[i]
-                    for j in range(self.num_wan):
-                        vec_j = self.xyz_cen[j]
-                        # get distance between orbitals
-                        dist_ijR = np.sqrt(
-                            np.dot(-vec_i + vec_j + vecR, -vec_i + vec_j + vecR)
-                        )
-                        # to prevent double counting
-                        if not (avoid_diagonal == True and j <= i):
-
-                            # only if distance between orbitals is small enough
-                            if max_distance is not None:
-                                if dist_ijR > max_distance:
-                                    continue
-
-                            # divide the matrix element from w90 with the degeneracy
-                            tmp_ham = self.ham_r[R]["h"][i, j] / float(
-                                self.ham_r[R]["deg"]
-                            )
-
-                            # only if big enough matrix element
-                            if min_hopping_norm is not None:
-                                if np.abs(tmp_ham) < min_hopping_norm:
-                                    continue
-
-                            # remove imaginary part if needed
-                            if ignorable_imaginary_part is not None:
-                                if np.abs(tmp_ham.imag) < ignorable_imaginary_part:
-                                    tmp_ham = tmp_ham.real + 0.0j
-
-                            # set the hopping term
-                            tb.set_hop(tmp_ham, i, j, list(R))
+        R0 = self._R_position((0, 0, 0))
+        onsite = np.diagonal(self._hr_ham[R0]) / float(self._hr_deg[R0])
+        if np.any(np.abs(onsite.imag) > 1.0e-9):
+            raise Exception("Onsite terms should be real!")
+        tb.set_onsite(onsite.real - zero_energy)
+
+        # add hopping terms, all (R,i,j) of a chunk of R-blocks at once
+        hr_R = np.array(self._hr_R, dtype=int)
+        # avoid taking both R and -R, keep R whose first non-zero
+        # component is positive (and R=0)
+        first_nonzero = np.argmax(hr_R != 0, axis=1)
+        first_comp = hr_R[np.arange(hr_R.shape[0]), first_nonzero]
+        use_R = np.where(first_comp >= 0)[0]
+        for chunk in self._R_chunks(use_R):
+            # matrix elements from w90 divided with the degeneracy,
+            # indices are [R,i,j]
+            tmp_ham = self._hr_ham[chunk] / np.array(self._hr_deg[chunk], dtype=float)[:, None, None]
+            keep = np.ones(tmp_ham.shape, dtype=bool)
+            # avoid onsite terms and double counting for R=0
+            is_zero_R = np.all(hr_R[chunk] == 0, axis=1)
+            keep[is_zero_R] &= np.triu(np.ones((self.num_wan, self.num_wan), dtype=bool), 1)
+            # only if distance between orbitals is small enough
+            if max_distance is not None:
+                keep &= self._R_distances(hr_R[chunk]) <= max_distance
+            # only if big enough matrix element
+            if min_hopping_norm is not None:
+                keep &= np.abs(tmp_ham) >= min_hopping_norm
+            (ind_R, ind_i, ind_j) = np.nonzero(keep)
+            amps = tmp_ham[ind_R, ind_i, ind_j]
+            # remove imaginary part if needed
+            if ignorable_imaginary_part is not None:
+                small_imag = np.abs(amps.imag) < ignorable_imaginary_part
+                amps[small_imag] = amps[small_imag].real + 0.0j
+            # set hopping terms of this chunk
+            tb.set_hops(amps, ind_i, ind_j, hr_R[chunk][ind_R])
 
         return tb
 
@@ -3681,35 +4311,22 @@ class w90(object):
 
         ret_ham = []
         ret_dist = []
-        for R in self.ham_r:
+        # go over R-blocks in chunks, indices of arrays are [R,i,j]
+        for chunk in self._R_chunks():
+            R = np.array(self._hr_R[chunk], dtype=int)
+            # divide the matrix element from w90 with the degeneracy
+            tmp_ham = self._hr_ham[chunk] / np.array(self._hr_deg[chunk], dtype=float)[:, None, None]
+            # get distance between orbitals
+            dist = self._R_distances(R)
             # treat diagonal terms differently
-            if R[0] == 0 and R[1] == 0 and R[2] == 0:
-                avoid_diagonal = True
-            else:
-                avoid_diagonal = False
-
-            # get R vector
-            vecR = _red_to_cart((self.lat[0], self.lat[1], self.lat[2]), [R])[0]
-            for i in range(self.num_wan):
-                vec_i = self.xyz_cen[i]
-                for j in range(self.num_wan):
-                    vec_j = self.xyz_cen[j]
-                    # diagonal terms
-                    if not (avoid_diagonal == True and i == j):
-
-                        # divide the matrix element from w90 with the degeneracy
-                        ret_ham.append(
-                            self.ham_r[R]["h"][i, j] / float(self.ham_r[R]["deg"])
-                        )
+            keep = np.ones(tmp_ham.shape, dtype=bool)
+            keep[np.all(R == 0, axis=1)] &= ~np.eye(self.num_wan, dtype=bool)
+            ret_ham.append(tmp_ham[keep])
+            ret_dist.append(dist[keep])
+        ret_ham = np.concatenate(ret_ham) if len(ret_ham) > 0 else np.zeros(0, dtype=complex)
+        ret_dist = np.concatenate(ret_dist) if len(ret_dist) > 0 else np.zeros(0, dtype=float)
 
-                        # get distance between orbitals
-                        ret_dist.append(
-                            np.sqrt(
-                                np.dot(-vec_i + vec_j + vecR, -vec_i + vec_j + vecR)
-                            )
-                        )
-
-        return (np.array(ret_dist), np.array(ret_ham))
+        return (ret_dist, ret_ham)
 
     def shells(self, num_digits=2):
         """
@@ -3732,22 +4349,14 @@ class w90(object):
         """
 
         shells = []
-        for R in self.ham_r:
-            # get R vector
-            vecR = _red_to_cart((self.lat[0], self.lat[1], self.lat[2]), [R])[0]
-            for i in range(self.num_wan):
-                vec_i = self.xyz_cen[i]
-                for j in range(self.num_wan):
-                    vec_j = self.xyz_cen[j]
-                    # get distance between orbitals
-                    dist_ijR = np.sqrt(
-                        np.dot(-vec_i + vec_j + vecR, -vec_i + vec_j + vecR)
-                    )
-                    # round it up
-                    shells.append(round(dist_ijR, num_digits))
+        # go over R vectors in chunks
+        for chunk in self._R_chunks():
+            # get distance between orbitals, round it up and remove duplicates
+            dist = self._R_distances(np.array(self._hr_R[chunk], dtype=int))
+            shells.append(np.unique(np.round(dist, num_digits)))
 
         # remove duplicates and sort
-        shells = np.sort(list(set(shells)))
+        shells = np.unique(np.concatenate(shells)) if len(shells) > 0 else np.zeros(0)
 
         return shells
 
@@ -3826,6 +4435,176 @@ class w90(object):
         return (kpts, ene)
 
 
+# version of the layout of the _hr.dat cache files
+_HR_CACHE_VERSION = 1
+
+# size (in bytes) of the part of _hr.dat converted at once
+_HR_READ_CHUNK = 64 * 1024**2
+
+
+def _parse_hr(fname, scratch=None):
+    """Parses Wannier90 _hr.dat file. Returns number of Wannier
+    functions, lattice vectors R[iR,:] in order of their appearance,
+    their degeneracies deg[iR], and blocks ham[iR,i,j] of <i|H|j+R>.
+    Numeric data is converted in chunks with np.fromstring. If scratch
+    (a binary file object) is given, blocks are stored in it as a
+    memory map instead of in memory."""
+    with open(fname, "r") as f:
+        f.readline()  # comment line
+        # get number of wannier functions
+        num_wan = int(f.readline())
+        # get number of Wigner-Seitz points
+        num_ws = int(f.readline())
+        # get degenereacies of Wigner-Seitz points
+        deg_ws = []
+        while len(deg_ws) < num_ws:
+            line = f.readline()
+            if line == "":
+                raise Exception("Too few degeneracies for WS points!")
+            deg_ws += [int(x) for x in line.split()]
+        if len(deg_ws) > num_ws:
+            raise Exception("Too many degeneracies for WS points!")
+        deg_ws = np.array(deg_ws, dtype=int)
+        # now read in matrix elements
+        ham_R = np.zeros((num_ws, 3), dtype=int)
+        if scratch is None:
+            ham = np.zeros((num_ws, num_wan, num_wan), dtype=complex)
+        else:
+            ham = np.memmap(scratch, dtype=complex, mode="w+", shape=(num_ws, num_wan, num_wan))
+        R_index = {}  # position of each R in ham_R
+        while True:
+            lines = f.readlines(_HR_READ_CHUNK)
+            if len(lines) == 0:
+                break
+            data = np.fromstring("".join(lines), dtype=float, sep=" ")
+            if data.size % 7 != 0:
+                raise Exception("Wrong format of matrix elements in " + fname + "!")
+            data = data.reshape((-1, 7))
+            rvec = np.array(np.round(data[:, :3]), dtype=int)
+            # new lattice vectors in order of their appearance
+            (uniq, first, inv) = np.unique(
+                rvec, axis=0, return_index=True, return_inverse=True
+            )
+            uniq_pos = np.zeros(len(uniq), dtype=int)
+            for u in np.argsort(first):
+                key = tuple(int(x) for x in uniq[u])
+                if key not in R_index:
+                    if len(R_index) == num_ws:
+                        raise Exception("More R vectors than Wigner-Seitz points!")
+                    ham_R[len(R_index)] = uniq[u]
+                    R_index[key] = len(R_index)
+                uniq_pos[u] = R_index[key]
+            ham_i = np.array(data[:, 3], dtype=int) - 1
+            ham_j = np.array(data[:, 4], dtype=int) - 1
+            ham[uniq_pos[inv.reshape(-1)], ham_i, ham_j] = data[:, 5] + 1.0j * data[:, 6]
+    if len(R_index) != num_ws:
+        raise Exception("Fewer R vectors than Wigner-Seitz points!")
+    return (num_wan, ham_R, deg_ws, ham)
+
+
+def _load_npz_mmap(fname):
+    """Loads arrays stored with np.savez (without compression) as
+    read-only memory maps of the file. Scalars are read directly."""
+    arrays = {}
+    with zipfile.ZipFile(fname) as zf:
+        infos = zf.infolist()
+    with open(fname, "rb") as f:
+        for info in infos:
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError("Compressed array in " + fname)
+            # skip local file header to get to the .npy data
+            f.seek(info.header_offset)
+            header = f.read(30)
+            if header[:4] != b"PK\x03\x04":
+                raise ValueError("Wrong zip header in " + fname)
+            (len_name, len_extra) = struct.unpack("<HH", header[26:30])
+            npy_start = info.header_offset + 30 + len_name + len_extra
+            f.seek(npy_start)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                (shape, fortran, dtype) = np.lib.format.read_array_header_1_0(f)
+            else:
+                (shape, fortran, dtype) = np.lib.format.read_array_header_2_0(f)
+            name = info.filename[:-4] if info.filename.endswith(".npy") else info.filename
+            if int(np.prod(shape)) <= 1:
+                # small arrays and scalars are simply read
+                f.seek(npy_start)
+                arrays[name] = np.lib.format.read_array(f)
+            else:
+                arrays[name] = np.memmap(
+                    fname,
+                    dtype=dtype,
+                    mode="r",
+                    shape=shape,
+                    offset=f.tell(),
+                    order="F" if fortran else "C",
+                )
+    return arrays
+
+
+def _load_hr(fname, use_cache=True, storage="memory"):
+    """Returns content of Wannier90 _hr.dat file as parsed by _parse_hr.
+    If use_cache is True, it is taken from the sidecar file fname.npz
+    when that file matches size and modification time of fname, and
+    otherwise fname is parsed and the sidecar file is (re)written. With
+    storage="memmap" R-blocks never have to fit into memory."""
+    stat = os.stat(fname)
+    cache = fname + ".npz"
+    if use_cache and os.path.exists(cache):
+        arr = _read_hr_cache(cache, stat)
+        if arr is not None:
+            return arr
+    if storage == "memmap":
+        # unnamed file, removed once the memory map is released
+        scratch = tempfile.TemporaryFile()
+    else:
+        scratch = None
+    (num_wan, ham_R, deg_ws, ham) = _parse_hr(fname, scratch=scratch)
+    if use_cache:
+        tmp = cache + "." + str(os.getpid()) + ".tmp"
+        try:
+            with open(tmp, "wb") as f:
+                np.savez(
+                    f,
+                    version=_HR_CACHE_VERSION,
+                    size=stat.st_size,
+                    mtime_ns=stat.st_mtime_ns,
+                    num_wan=num_wan,
+                    R=ham_R,
+                    deg=deg_ws,
+                    ham=ham,
+                )
+            os.replace(tmp, cache)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        else:
+            if storage == "memmap":
+                # use the cache instead of the temporary file
+                arr = _read_hr_cache(cache, stat)
+                if arr is not None:
+                    del ham
+                    scratch.close()
+                    return arr
+    return (num_wan, ham_R, deg_ws, ham)
+
+
+def _read_hr_cache(cache, stat):
+    """Returns arrays of _hr.dat from cache file, or None if the cache
+    does not match the file with os.stat result stat."""
+    try:
+        arr = _load_npz_mmap(cache)
+        if (
+            int(arr["version"]) == _HR_CACHE_VERSION
+            and int(arr["size"]) == stat.st_size
+            and int(arr["mtime_ns"]) == stat.st_mtime_ns
+        ):
+            return (int(arr["num_wan"]), arr["R"], arr["deg"], arr["ham"])
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        pass
+    return None
+
+
 def _cart_to_red(tmp, cart):
     "Convert cartesian vectors cart to reduced coordinates of a1,a2,a3 vectors"
     (a1, a2, a3) = tmp
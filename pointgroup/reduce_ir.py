@@ -1,31 +1,31 @@
 from .get_character import GetCharacter
 from .schonflies import point_group_map
-from .pglib import point_group, find_operation_type, output_sym_op_name
+from .pglib import (
+    point_group,
+    character_tables,
+    find_operation_type,
+)
 from .sym_op import apply_for_orb
 from .utils import logger
 import numpy as np
 import copy
 
+
 class GetIR:
     def __init__(self, getc: GetCharacter):
         self.getc = getc
-        self.pg = point_group_map[getc.pg]
+        self.ctx = getc.get_symmetry_context()
+        self.pg = point_group_map[self.ctx.pg]
         self.ir_ch_all = point_group[self.pg]  ## 点群
+        self.table = character_tables[self.pg]
         self.ir_ch = None
         self.h = 0
 
     def _get_h(self):
-        h = 0
-        for sym_op, ch in self.ir_ch_all.items():
-            try:
-                x = int(sym_op[0])
-            except ValueError:
-                x = 1
-            h += x
-        return h
-    
+        return self.table.order
+
     def _get_ir(self):
-        return len(self.ir_ch_all["E"])
+        return self.table.nirrep
 
     def _get_ir_ch_old(self, ir_idx):
         ir_ch = []
@@ -50,7 +50,6 @@ class GetIR:
                 else:
                     op_name = op_name_save
                 if k == op_name:
-                    # print(op_name, k)
                     ch = v
                     ir_ch.append(ch[ir_idx])
                     break
@@ -69,24 +68,47 @@ class GetIR:
         return np.array(ir_ch)
     
     def _get_ir_ch(self, ir_idx):
-        ir_ch = []
-        rot_o3 = self.getc.rot_o3
-        # rot_o3 = self.getc.rot
-        for i in range(rot_o3.shape[0]):
-            op_name, disc = find_operation_type(rot_o3[i])
-            op_name2 = output_sym_op_name(self.pg, op_name)
-            print(f"{op_name2} {op_name}")
-            for k, ch in self.ir_ch_all.items():
-                if k == op_name2:
-                    # print(k, op_name, op_name2, disc, ch[ir_idx], ir_idx)
-                    ir_ch.append(ch[ir_idx])
-        print()
-        return np.array(ir_ch)
+        """
+        各対称操作に対する既約表現ir_idxの指標を返す。
+        操作は積表から求めたクラス番号で指標表に対応させる（対応無しは0）。
+        """
+        return self._get_op_table()[:, ir_idx]
+
+    def _get_op_class_idx(self):
+        """
+        各対称操作が対応する指標表のクラス番号を返す（対応無しは-1）。
+        群の積表から求めた共役類に基づき、構造ごとにキャッシュされる。
+        """
+        return self.ctx.class_ids()
+
+    def _get_op_table(self):
+        """
+        各対称操作に対する全既約表現の指標 (nops, nirrep) を返す。
+        reduce_irとreduce_allはこの対応を共有する（対応するクラスが無い操作は0）。
+        """
+        op_class = self._get_op_class_idx()
+        return np.where((op_class >= 0)[:, None], self.table.table[op_class], 0.0)
+
+    def reduce_all(self, ch: np.ndarray):
+        """
+        キャラクター配列を全既約表現に一括で分解する。
+        reduce_irを全ての既約表現について呼んだ結果と同じ値を返す。
+
+        Parameters
+        ----------
+        ch : ndarray
+            (..., nops) のキャラクター配列（GetCharacter.get_character_tensorの出力など）
+
+        Returns
+        -------
+        w : ndarray
+            (..., nirrep) の各既約表現の重み
+        """
+        return np.asarray(ch) @ self._get_op_table() / self.table.order
 
     def reduce_ir(self, ch: np.ndarray, ir_idx=0):
         h = self._get_h()
         ir_ch = self._get_ir_ch(ir_idx)
-        # print(ch, self.ir_ch)
         logger.info(f"target ch:{ch}")
         logger.info(f" irrep ch:{ir_ch}")
 
@@ -1,6 +1,6 @@
 from .get_character import GetCharacter
 from .schonflies import point_group_map
-from .pglib import point_group, output_sym_op_name, find_operation_type
+from .pglib import point_group, character_tables
 from .sym_op import apply_for_orb, get_diff
 import numpy as np
 
@@ -20,12 +20,14 @@ class GetSALC:
             キャラクター計算用インスタンス
         """
         self.getc = getc
-        self.pg = point_group_map[getc.pg]
+        self.ctx = getc.get_symmetry_context()
+        self.pg = point_group_map[self.ctx.pg]
         self.ir_ch = point_group[self.pg]  # 点群
+        self.table = character_tables[self.pg]
         self.pos = getc.pos
-        self.translate = getc.trans
-        self.rot = getc.rot
-        self.rot_o3 = getc.rot_o3
+        self.translate = self.ctx.trans
+        self.rot = self.ctx.rot
+        self.rot_o3 = self.ctx.rot_o3
         self.order = 4
 
     def _gen_site_amps(self):
@@ -44,19 +46,6 @@ class GetSALC:
             results.append(amp_site)
         return results
 
-    def _search_op(self, op):
-        """
-        与えられたO(3)行列opに最も近い点群操作名を検索する。
-        Returns
-        -------
-        op_name : str or None
-            一致する操作名（なければNone）
-        """
-        op_name, disc = find_operation_type(op)
-        op_name = output_sym_op_name(self.pg, op_name)
-        return op_name
-
-
     def make_salc_site(self, sym_idx=0):
         """
         指定した対称操作インデックスに対するSALC重みを計算する。
@@ -73,9 +62,11 @@ class GetSALC:
         # s軌道的な対称性のみ対象
         # より精密には軌道のgrid情報必要
         rot = self.rot
-        rot_o3 = self.rot_o3
         trs = self.translate
         nops = self.rot.shape[0]
+        # 各操作の指標は積表から求めたクラス番号で指標表から読む（対応無しは0）
+        class_ids = self.ctx.class_ids()
+        op_ch = np.where(class_ids >= 0, self.table.table[class_ids, sym_idx], 0.0)
         site_amps = self._gen_site_amps()
         weights = {}
         for samp in site_amps:
@@ -87,17 +78,16 @@ class GetSALC:
                 weights[(x, y, z)] = 0
         for samp in site_amps:
             for n in range(nops):
-                op_name = self._search_op(rot_o3[n])
                 applied = apply_for_orb(samp, rot[n], trs[n])
                 for xyz, amp in applied.items():
                     x, y, z = xyz
                     pos = np.array([x, y, z])
                     pos_diffs = get_diff(pos.copy(), None)
-                    weights = self._get_new_weight(samp, amp, pos_diffs, weights, op_name, sym_idx)
+                    weights = self._get_new_weight(samp, amp, pos_diffs, weights, op_ch[n])
                 
         return weights
     
-    def _get_new_weight(self, site_amp, amp, pos_diffs, weights, op_name, sym_idx):
+    def _get_new_weight(self, site_amp, amp, pos_diffs, weights, ch):
         ok = False
         for xyz_ori in site_amp:
             x_, y_, z_ = xyz_ori
@@ -108,7 +98,7 @@ class GetSALC:
                     x_tr = round(x_tr, self.order)
                     y_tr = round(y_tr, self.order)
                     z_tr = round(z_tr, self.order)
-                    weights[(x_tr, y_tr, z_tr)] += amp * self.ir_ch[op_name][sym_idx]
+                    weights[(x_tr, y_tr, z_tr)] += amp * ch
                     ok = True
                     break
             if ok:
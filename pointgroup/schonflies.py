@@ -8,6 +8,7 @@ point_group_map = {
     "222": "D2",
     "mm2": "C2v",
     "2/mmm": "D2h",
+    "mmm": "D2h",  # spglibの表記
     "4": "C4",
     "-4": "S4",
     "4/m": "C4h",
@@ -29,6 +30,7 @@ point_group_map = {
     "6/mmm": "D6h",
     "23": "T",
     "m3": "Th",
+    "m-3": "Th",  # spglibの表記
     "432": "O",
     "-43m": "Td",
     "m-3m": "Oh",
@@ -1,6 +1,8 @@
 import numpy as np
 from itertools import product
 import copy
+from scipy.spatial import cKDTree
+from scipy import sparse
 
 def apply_sym_for_all(
     pos: np.ndarray, rot: np.ndarray, trans: np.ndarray
@@ -25,6 +27,162 @@ def apply_for_orb(amps_dict: dict, rot, trs):  ### dic[(x,y,z)] = amp
         transformed[(x, y, z)] = amp
     return transformed
 
+def wrap_to_cell(pos, tol=1e-6):
+    """分率座標を単位胞 [0, 1) に戻す。1との差がtol未満の成分は0とする。"""
+    wrapped = np.mod(pos, 1.0)
+    wrapped[np.abs(wrapped - 1.0) < tol] = 0.0
+    return wrapped
+
+
+class SitePermutation:
+    """
+    各対称操作によるサイトの置換表。
+    R @ pos[i] + t = pos[perm[g, i]] + G[g, i] を満たす
+    置換先サイト perm と格子並進 G を保持する。
+    対応するサイトが無い場合は perm = -1 とする。
+    """
+
+    def __init__(self, pos, rot, trans, tol=1e-6):
+        """
+        Parameters
+        ----------
+        pos : array_like
+            サイトの分率座標 (nsite, 3)
+        rot : array_like
+            回転行列 (nops, 3, 3)
+        trans : array_like
+            並進ベクトル (nops, 3)
+        tol : float
+            座標一致の許容誤差（分率座標）
+        """
+        pos = np.asarray(pos, dtype=float)
+        rot = np.asarray(rot)
+        trans = np.asarray(trans, dtype=float)
+        nops = rot.shape[0]
+        nsite = pos.shape[0]
+        self.tol = tol
+
+        new_pos = np.einsum("gab,jb->gja", rot, pos) + trans[:, None, :]
+        tree = cKDTree(wrap_to_cell(pos, tol), boxsize=1.0)
+        dist, idx = tree.query(
+            wrap_to_cell(new_pos.reshape(-1, 3), tol), distance_upper_bound=tol
+        )
+        found = np.isfinite(dist)
+        perm = np.where(found, idx, -1).reshape(nops, nsite)
+
+        G = np.zeros((nops, nsite, 3), dtype=int)
+        ok = perm >= 0
+        G[ok] = np.rint(new_pos[ok] - pos[perm[ok]]).astype(int)
+
+        self.pos = pos
+        self.rot = rot
+        self.perm = perm
+        self.G = G
+        for arr in (self.pos, self.perm, self.G):
+            arr.setflags(write=False)
+
+    @property
+    def nops(self):
+        return self.perm.shape[0]
+
+    @property
+    def nsite(self):
+        return self.perm.shape[1]
+
+    def fixed_sites(self):
+        """
+        各操作で格子並進を除いて動かないサイトを (nops, nsite) の真偽値配列で返す。
+        """
+        return self.perm == np.arange(self.nsite)[None, :]
+
+    def bloch_phases(self, k, ops=None):
+        """
+        波数kでの表現行列 D(g, k) の非零要素（位相）を返す。
+        D[g, perm[g, i], i] = exp(-2πi k・(G[g, i] + pos[perm[g, i]] - pos[i]))
+        gはkの小群に属する操作であること。
+
+        Parameters
+        ----------
+        k : array_like
+            分率座標のk点
+        ops : array_like of int, optional
+            対称操作インデックス（デフォルト: 全対称操作）
+
+        Returns
+        -------
+        phases : ndarray
+            (nops, nsite) の複素位相。対応サイトが無い要素は0。
+        """
+        if ops is None:
+            ops = np.arange(self.nops)
+        k = np.asarray(k, dtype=float)
+        perm = self.perm[ops]
+        ok = perm >= 0
+        shift = self.G[ops] + self.pos[np.where(ok, perm, 0)] - self.pos[None, :, :]
+        phases = np.exp(-2.0j * np.pi * np.einsum("gia,a->gi", shift, k))
+        return np.where(ok, phases, 0.0)
+
+    def rep_matrices(self, k, ops=None):
+        """
+        波数kでの各対称操作の表現行列 D(g, k) を疎行列（CSR）のリストで返す。
+        """
+        if ops is None:
+            ops = np.arange(self.nops)
+        phases = self.bloch_phases(k, ops)
+        cols = np.arange(self.nsite)
+        mats = []
+        for g, op in enumerate(ops):
+            ok = self.perm[op] >= 0
+            mats.append(
+                sparse.csr_matrix(
+                    (phases[g, ok], (self.perm[op, ok], cols[ok])),
+                    shape=(self.nsite, self.nsite),
+                )
+            )
+        return mats
+
+    def bloch_characters(self, U, k, ops=None):
+        """
+        バンドの波動関数Uに対するキャラクター <u_b|D(g, k)|u_b> を計算する。
+        einsum('bi,gij,bj->bg', conj(U), D, U) を置換表のgatherで評価する。
+
+        Parameters
+        ----------
+        U : array_like
+            (nband, nsite) の固有ベクトル
+        k : array_like
+            分率座標のk点
+        ops : array_like of int, optional
+            対称操作インデックス（kの小群に属すること）
+
+        Returns
+        -------
+        characters : ndarray
+            (nband, nops) の複素キャラクター
+        """
+        if ops is None:
+            ops = np.arange(self.nops)
+        U = np.asarray(U)
+        phases = self.bloch_phases(k, ops)
+        perm = self.perm[ops]
+        U_perm = U[:, np.where(perm >= 0, perm, 0)]  # nband, nops, nsite
+        return np.einsum("bgi,gi,bi->bg", U_perm.conj(), phases, U)
+
+
+def little_group_ops(rot, k, tol=1e-6):
+    """
+    R・k ≡ k (mod G) を満たす対称操作（kの小群）のインデックスを返す。
+    回転は分率座標での行列とし、kは (R^{-1})^T で変換する。
+    """
+    rot = np.asarray(rot)
+    k = np.asarray(k, dtype=float)
+    rot_inv = np.linalg.inv(rot)
+    k_new = np.einsum("a,gab->gb", k, rot_inv)
+    diff = k_new - k[None, :]
+    diff -= np.rint(diff)
+    return np.where(np.all(np.abs(diff) < tol, axis=1))[0]
+
+
 def get_diff(pos, cell):
     deltas = [-2, -1, 0, 1, 2]
     offsets = list(product(deltas, repeat=3))
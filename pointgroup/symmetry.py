@@ -0,0 +1,172 @@
+from collections import OrderedDict
+import hashlib
+import numpy as np
+import spglib
+from .pglib import tr2o3, classify_many, point_group, assign_class_ids
+from .schonflies import point_group_map
+from .sym_op import SitePermutation, little_group_ops, wrap_to_cell
+
+## プロセス全体で共有する対称性情報のLRUキャッシュ
+_CONTEXT_CACHE = OrderedDict()
+CONTEXT_CACHE_SIZE = 32
+
+
+class LittleGroup:
+    """
+    k点の小群（R・k ≡ k (mod G) を満たす操作の集合）と、
+    その点群記号・指標表をまとめたクラス。
+    """
+
+    def __init__(self, k, ops, rot):
+        """
+        Parameters
+        ----------
+        k : array_like
+            分率座標のk点
+        ops : ndarray of int
+            小群に属する対称操作のインデックス
+        rot : ndarray
+            全対称操作の回転行列 (nops, 3, 3)
+        """
+        self.k = np.array(k, dtype=float)
+        self.ops = ops
+        self.ops.setflags(write=False)
+        rot_k = np.ascontiguousarray(rot[ops], dtype="intc")
+        self.pg = spglib.spglib.get_pointgroup(rot_k)[0]
+        self.pg_schonflies = point_group_map[self.pg]
+        self.char_table = point_group[self.pg_schonflies]
+
+    @property
+    def order(self):
+        return len(self.ops)
+
+
+class SymmetryContext:
+    """
+    1つの構造 (cell, pos, species, symprec) に対する対称性情報をまとめたクラス。
+    spglibのデータセット、回転・並進、O(3)回転行列、操作の分類を一度だけ計算し、
+    GetCharacter・GetIR・GetSALCの間で共有する。
+    """
+
+    def __init__(self, cell, pos, species, symprec=1e-5):
+        """
+        Parameters
+        ----------
+        cell : array_like
+            格子ベクトル (3, 3)
+        pos : array_like
+            サイトの分率座標 (nsite, 3)
+        species : array_like
+            サイト種別
+        symprec : float
+            spglibの対称性判定の許容誤差
+        """
+        self.cell = np.array(cell, dtype=float)
+        self.pos = np.array(pos, dtype=float)
+        self.species = np.array(species)
+        self.symprec = symprec
+
+        spg_cell = (self.cell, self.pos, self.species)
+        self.dataset = spglib.spglib.get_symmetry_dataset(spg_cell, symprec=symprec)
+        self.symm_ops = spglib.spglib.get_symmetry(spg_cell, symprec=symprec)
+        self.rot = self.symm_ops["rotations"]
+        self.trans = self.symm_ops["translations"]
+        self.spg = self.dataset["international"]
+        self.pg = self.dataset["pointgroup"]
+
+        self.rot_o3 = np.zeros(self.rot.shape, dtype=float)
+        for i in range(self.rot_o3.shape[0]):
+            self.rot_o3[i, :, :] = tr2o3(self.cell, self.rot[i, :, :])
+        # 複数のインスタンスで共有するため読み取り専用にする
+        for arr in (self.rot, self.trans, self.rot_o3):
+            arr.setflags(write=False)
+        self._op_classes = None
+        self._site_perms = {}
+        self._little_groups = {}
+        self._class_ids = None
+
+    @property
+    def nsymm_ops(self):
+        return self.rot.shape[0]
+
+    @property
+    def op_classes(self):
+        """
+        各対称操作の (op_name, description) のリスト。初回参照時に計算する。
+        """
+        if self._op_classes is None:
+            self._op_classes = classify_many(self.rot_o3)
+        return self._op_classes
+
+    def class_ids(self):
+        """
+        各対称操作の指標表（CharacterTable）でのクラス番号。
+        積表から求めた共役類で決め、初回参照時に一度だけ計算する。
+        """
+        if self._class_ids is None:
+            self._class_ids = assign_class_ids(
+                self.rot, point_group_map[self.pg], cell=self.cell
+            )
+            self._class_ids.setflags(write=False)
+        return self._class_ids
+
+    def site_permutation(self, tol=1e-6):
+        """
+        サイト置換表 SitePermutation を返す。許容誤差ごとに一度だけ構築する。
+        """
+        if tol not in self._site_perms:
+            self._site_perms[tol] = SitePermutation(
+                self.pos, self.rot, self.trans, tol=tol
+            )
+        return self._site_perms[tol]
+
+    def little_group(self, k, tol=1e-6):
+        """
+        k点の小群 LittleGroup を返す。k点（単位胞に戻した座標）ごとにメモ化する。
+        """
+        k = np.asarray(k, dtype=float)
+        key = (tuple(np.round(wrap_to_cell(k, tol), 8)), tol)
+        if key not in self._little_groups:
+            ops = little_group_ops(self.rot, k, tol=tol)
+            self._little_groups[key] = LittleGroup(k, ops, self.rot)
+        return self._little_groups[key]
+
+
+def _context_key(cell, pos, species, symprec):
+    """
+    構造からキャッシュキー（ハッシュ値）を生成する。
+    """
+    h = hashlib.sha1()
+    for arr in (cell, pos):
+        arr = np.ascontiguousarray(arr, dtype=float)
+        h.update(str(arr.shape).encode())
+        h.update(arr.tobytes())
+    h.update(repr(np.asarray(species).tolist()).encode())
+    h.update(repr(float(symprec)).encode())
+    return h.hexdigest()
+
+
+def get_symmetry_context(cell, pos, species, symprec=1e-5):
+    """
+    構造に対応するSymmetryContextをLRUキャッシュから取得する。
+    キャッシュに無ければ新たに生成して登録する。
+
+    Returns
+    -------
+    ctx : SymmetryContext
+    """
+    key = _context_key(cell, pos, species, symprec)
+    ctx = _CONTEXT_CACHE.get(key)
+    if ctx is not None:
+        _CONTEXT_CACHE.move_to_end(key)
+        return ctx
+    ctx = SymmetryContext(cell, pos, species, symprec=symprec)
+    _CONTEXT_CACHE[key] = ctx
+    while len(_CONTEXT_CACHE) > CONTEXT_CACHE_SIZE:
+        _CONTEXT_CACHE.popitem(last=False)
+    return ctx
+
+
+def clear_symmetry_cache():
+    _CONTEXT_CACHE.clear()
+    return
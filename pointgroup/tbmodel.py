@@ -20,6 +20,7 @@ class TBModel:
         pythtb_obj: tb_model = None,
         lat: list = None, # [[1, 0, 0],[0, 1, 0],[0, 0, 1]],
         orb: list = None, # [[0, 0, 0]]
+        n_workers: int = None,
     ):
         """
         Parameters
@@ -38,6 +39,8 @@ class TBModel:
             サイトごとの軌道情報
         pythtb_obj : tb_model, optional
             既存のpythtbオブジェクト
+        n_workers : int, optional
+            バンド計算に使うプロセス数（Noneなら逐次計算）
         """
         self.path = wannier_path
         self.prefix = wannier_prefix
@@ -58,6 +61,7 @@ class TBModel:
         self.lat = lat
         self.orb = orb
         self.do_standard = False
+        self.n_workers = n_workers
 
     def init_tbmodel(self):
         assert self.lat is not None
@@ -161,6 +165,8 @@ class TBModel:
         """
         if k is not None:
             self.kpts = [k]
-        (eval, evec) = self.pythtb_obj.solve_all(self.kpts, eig_vectors=True)
+        (eval, evec) = self.pythtb_obj.solve_all(
+            self.kpts, eig_vectors=True, n_workers=self.n_workers
+        )
         self.Umat = evec
         return eval
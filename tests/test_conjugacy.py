@@ -0,0 +1,41 @@
+import importlib
+import numpy as np
+from pointgroup.pglib import character_tables
+from pointgroup.schonflies import point_group_map
+from pointgroup.symmetry import get_symmetry_context
+
+def test_import():
+    importlib.import_module('pointgroup.pglib.conjugacy')
+
+
+def test_class_ids():
+    structures = [
+        ([[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]], [[0.0, 0.0, 0.0]], [1]),
+        ([[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 10.0]], [[0.0, 0.0, 0.0], [0.5, 0.5, 0.0]], [1, 2]),
+        ([[1.0, 0.0, 0.0], [0.5, np.sqrt(3.0) / 2.0, 0.0], [0.0, 0.0, 1.0]], [[1/3, 1/3, 0.0], [2/3, 2/3, 0.0]], [1, 1]),
+        ([[1.0, 0.0, 0.0], [0.0, 1.25, 0.0], [0.0, 0.0, 3.0]], [[0.0, 0.0, 0.0], [0.5, 0.5, 0.0]], [1, 2]),
+    ]
+    for lat, pos, species in structures:
+        ctx = get_symmetry_context(lat, pos, species)
+        table = character_tables[point_group_map[ctx.pg]]
+        ids = ctx.class_ids()
+        assert ids is ctx.class_ids()
+        assert np.all(np.bincount(ids, minlength=table.nclass) == table.class_sizes)
+
+
+def test_class_ids_repeated_rotations():
+    # 体心立方の慣用単位胞と正方晶の1x1x2超格子では回転が並進ごとに繰り返される
+    structures = [
+        (np.eye(3), [[0.0, 0.0, 0.0], [0.5, 0.5, 0.5]], [1, 1], 2),
+        (np.diag([1.0, 1.0, 3.0]), [[0.0, 0.0, 0.0], [0.0, 0.0, 0.5]], [1, 1], 2),
+    ]
+    for lat, pos, species, ntrans in structures:
+        ctx = get_symmetry_context(lat, pos, species)
+        table = character_tables[point_group_map[ctx.pg]]
+        ids = ctx.class_ids()
+        assert len(ids) == ctx.nsymm_ops == ntrans * table.order
+        assert np.all(np.bincount(ids, minlength=table.nclass) == ntrans * table.class_sizes)
+        # 同じ回転は同じクラス
+        for a in range(ctx.nsymm_ops):
+            same = np.all(ctx.rot == ctx.rot[a], axis=(1, 2))
+            assert np.all(ids[same] == ids[a])
@@ -1,4 +1,86 @@
 import importlib
+import numpy as np
+from pointgroup import GetCharacter, TBModel, tb_model
 
 def test_import():
     importlib.import_module('pointgroup.get_character')
+
+
+def _checkerboard():
+    lat=[[1.0,0.0,0.0],[0.0,1.0,0.0],[0.0,0.0,10.0]]
+    orb=[[0.0,0.0,0.0],[0.5,0.5,0.0]]
+    my_model=tb_model(3,3,lat,orb)
+    my_model.set_onsite([1.1, 1.1])
+    my_model.set_hop(0.6, 1, 0, [0, 0, 0])
+    my_model.set_hop(0.6, 1, 0, [1, 0, 0])
+    my_model.set_hop(0.6, 1, 0, [0, 1, 0])
+    my_model.set_hop(0.6, 1, 0, [1, 1, 0])
+    tb = TBModel(pythtb_obj=my_model, site_species=[1, 1], nk=[2, 2, 1])
+    tb.gen_pythtb()
+    return tb
+
+
+def test_character_tensor():
+    tb = _checkerboard()
+    for use_trace in [True, False]:
+        gcclass = GetCharacter(tb)
+        gcclass.use_trace = use_trace
+        n = gcclass._get_symm_ops()
+        tensor = gcclass.get_character_tensor()
+        nk = len(tb.kpts)
+        assert tensor.shape == (nk, 2, n)
+        for kidx in range(nk):
+            for orb_idx in range(2):
+                for op_idx in range(n):
+                    ch = gcclass.get_character(kidx=kidx, orb_idx=orb_idx, op_idx=op_idx)
+                    assert tensor[kidx, orb_idx, op_idx] == ch
+
+
+def test_character_band_subset():
+    # バンド数と軌道数が異なる固有ベクトル Umat[band, k, site]
+    tb = _checkerboard()
+    full = GetCharacter(tb)
+    tensor_full = full.get_character_tensor()
+    bloch_full = full.get_bloch_character()
+    tb.Umat = tb.Umat[1:]
+    gcclass = GetCharacter(tb)
+    n = gcclass._get_symm_ops()
+    nk = len(tb.kpts)
+    tensor = gcclass.get_character_tensor()
+    assert tensor.shape == (nk, 1, n)
+    assert np.array_equal(tensor[:, 0], tensor_full[:, 1])
+    for kidx in range(nk):
+        for op_idx in range(n):
+            ch = gcclass.get_character(kidx=kidx, orb_idx=0, op_idx=op_idx)
+            assert tensor[kidx, 0, op_idx] == ch
+    bloch = gcclass.get_bloch_character()
+    assert bloch.shape == (nk, 1, n)
+    assert np.allclose(bloch[:, 0], bloch_full[:, 1], equal_nan=True)
+
+
+def test_bloch_character():
+    tb = _checkerboard()
+    gcclass = GetCharacter(tb)
+    chars = gcclass.get_bloch_character()
+    perm = gcclass.symm_ctx.site_permutation()
+    for kidx, k in enumerate(tb.kpts):
+        ham = tb.pythtb_obj._gen_ham(k)
+        ops = np.where(~np.isnan(chars[kidx, 0]))[0]
+        assert 0 in ops
+        for op, D in zip(ops, perm.rep_matrices(k, ops)):
+            D = D.toarray()
+            assert np.allclose(D @ ham, ham @ D)
+        # 非縮退バンドのキャラクターは絶対値1
+        evals = np.linalg.eigvalsh(ham)
+        if abs(evals[1] - evals[0]) > 1e-6:
+            assert np.allclose(np.abs(chars[kidx][:, ops]), 1.0)
+
+
+def test_little_groups():
+    tb = _checkerboard()
+    gcclass = GetCharacter(tb)
+    lgs = gcclass.get_little_groups()
+    assert len(lgs) == len(tb.kpts)
+    assert lgs[0].order == gcclass.symm_ctx.nsymm_ops
+    path_lgs = gcclass.get_path_little_groups()
+    assert path_lgs["GAMMA"].pg == gcclass.symm_ctx.pg
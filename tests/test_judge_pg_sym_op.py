@@ -0,0 +1,30 @@
+import importlib
+import numpy as np
+from pointgroup.pglib.judge_pg_sym_op import (
+    generate_all_representation_matrices,
+    classify_symmetry_operation,
+    lookup_operation,
+    classify_many,
+)
+
+def test_import():
+    importlib.import_module('pointgroup.pglib.judge_pg_sym_op')
+
+
+def test_lookup():
+    matrices = generate_all_representation_matrices(3)
+    for m in matrices:
+        op_name, description = classify_symmetry_operation(m)
+        assert lookup_operation(m) == (op_name, description)
+    c = np.cos(2 * np.pi / 3)
+    s = np.sin(2 * np.pi / 3)
+    c3 = np.array([[c, -s, 0.0], [s, c, 0.0], [0.0, 0.0, 1.0]])
+    assert lookup_operation(c3)[0] == "C3(z)"
+
+
+def test_classify_many():
+    matrices = np.array(generate_all_representation_matrices(3) * 2)
+    results = classify_many(matrices)
+    assert len(results) == len(matrices)
+    for m, ret in zip(matrices, results):
+        assert ret == lookup_operation(m)
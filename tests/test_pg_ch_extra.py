@@ -8,4 +8,13 @@ def test_num():
     assert len(point_group) == 32
 
 
-
+def test_character_tables():
+    import numpy as np
+    from pointgroup.pglib import character_tables
+    assert len(character_tables) == 32
+    oh = character_tables["Oh"]
+    assert oh.order == 48
+    assert oh.class_sizes[oh.class_index["8C3"]] == 8
+    assert oh.table.shape == (oh.nclass, oh.nirrep)
+    assert not oh.table.flags.writeable
+    assert np.all(oh.table[oh.class_index["E"]] == [1, 1, 1, 1, 2, 2, 3, 3, 3, 3])
@@ -1,4 +1,347 @@
 import importlib
+import numpy as np
+import pytest
+from pointgroup import pythtb_respack
+from pointgroup.pythtb_respack import tb_model, wf_array, w90
 
 def test_import():
     importlib.import_module('pointgroup.pythtb_respack')
+
+
+def _ref_ham(m, k):
+    # tb_model._gen_hamのループ実装
+    if m._nspin == 1:
+        ham = np.zeros((m._norb, m._norb), dtype=complex)
+    else:
+        ham = np.zeros((m._norb, 2, m._norb, 2), dtype=complex)
+    for i in range(m._norb):
+        if m._nspin == 1:
+            ham[i, i] = m._site_energies[i]
+        else:
+            ham[i, :, i, :] = m._site_energies[i]
+    for h in m._hoppings:
+        amp = complex(h[0]) if m._nspin == 1 else np.array(h[0], dtype=complex)
+        i, j = h[1], h[2]
+        if m._dim_k > 0:
+            rv = (-m._orb[i] + m._orb[j] + np.array(h[3], dtype=float))[m._per]
+            amp = amp * np.exp(2.0j * np.pi * np.dot(k, rv))
+        if m._nspin == 1:
+            ham[i, j] += amp
+            ham[j, i] += np.conj(amp)
+        else:
+            ham[i, :, j, :] += amp
+            ham[j, :, i, :] += amp.T.conj()
+    return ham
+
+
+def _model(nspin=1):
+    lat = [[1.0, 0.0], [0.3, 1.0]]
+    orb = [[0.0, 0.0], [0.5, 0.2], [0.1, 0.7]]
+    m = tb_model(2, 2, lat, orb, nspin=nspin)
+    m.set_onsite([0.1, 0.2, -0.3])
+    m.set_hop(0.3 + 0.1j, 0, 1, [0, 0])
+    m.set_hop(-0.2, 1, 2, [1, 0])
+    m.set_hop(0.5, 0, 0, [0, 1])
+    m.set_hop(0.1j, 2, 0, [1, -1])
+    if nspin == 2:
+        m.set_hop([0.0, 0.1, 0.2, 0.3], 0, 2, [0, 0])
+    return m
+
+
+def test_gen_ham_batch():
+    rng = np.random.default_rng(0)
+    ks = rng.random((6, 2))
+    for nspin in [1, 2]:
+        m = _model(nspin)
+        ham = m.gen_ham_batch(ks)
+        for n, k in enumerate(ks):
+            assert np.allclose(ham[n], _ref_ham(m, k))
+        # 変更後はコンパイル済みの配列が作り直される
+        m.set_hop(1.0, 0, 1, [0, 0], mode="reset")
+        m.set_onsite(0.5, 2, mode="add")
+        assert np.allclose(m._gen_ham(ks[0]), _ref_ham(m, ks[0]))
+    fin = _model().cut_piece(3, 0).cut_piece(2, 1)
+    assert np.allclose(fin._gen_ham(), _ref_ham(fin, None))
+
+
+def test_solve_all_chunks():
+    rng = np.random.default_rng(1)
+    ks = rng.random((20, 2))
+    m = _model()
+    (eval, evec) = m.solve_all(ks, eig_vectors=True, chunk_size=7)
+    for n, k in enumerate(ks):
+        (ev, ec) = m._sol_ham(m._gen_ham(k), eig_vectors=True)
+        assert np.allclose(eval[:, n], ev)
+        assert np.allclose(np.abs(np.sum(evec[:, n, :].conj() * ec, axis=1)), 1.0)
+    eval2 = m.solve_all(ks, chunk_size=1, herm_check="sample")
+    assert np.allclose(eval, eval2)
+    eval3 = m.solve_all(ks, herm_check="none")
+    assert np.allclose(eval, eval3)
+
+
+def test_solve_all_parallel(monkeypatch):
+    rng = np.random.default_rng(2)
+    ks = rng.random((9, 2))
+    for nspin in [1, 2]:
+        m = _model(nspin)
+        (eval, evec) = m.solve_all(ks, eig_vectors=True)
+        (eval2, evec2) = m.solve_all(ks, eig_vectors=True, n_workers=2, chunk_size=2)
+        assert np.allclose(eval, eval2)
+        assert evec2.shape == evec.shape
+        assert np.allclose(m.solve_all(ks, n_workers=2), eval)
+    m = _model()
+    wf = wf_array(m, [4, 3])
+    gaps = wf.solve_on_grid([0.0, 0.0])
+    wf2 = wf_array(m, [4, 3])
+    gaps2 = wf2.solve_on_grid([0.0, 0.0], n_workers=2)
+    assert np.allclose(gaps, gaps2)
+    assert np.allclose(np.abs(wf._wfs), np.abs(wf2._wfs))
+    # chunks of memory-mapped grid are solved by the same workers
+    pools = []
+
+    class CountedPool(pythtb_respack._SolvePool):
+        def __init__(self, *args):
+            pools.append(self)
+            super().__init__(*args)
+
+    monkeypatch.setattr(pythtb_respack, "_SolvePool", CountedPool)
+    monkeypatch.setattr(pythtb_respack, "WF_MEMORY_BUDGET", 1)
+    wf3 = wf_array(m, [4, 3], storage="memmap")
+    gaps3 = wf3.solve_on_grid([0.0, 0.0], n_workers=2)
+    assert len(pools) == 1
+    assert np.allclose(gaps, gaps3)
+    assert np.allclose(np.abs(wf._wfs), np.abs(wf3._wfs))
+
+
+def test_solve_window():
+    k = [0.3, 0.1]
+    for nspin in [1, 2]:
+        m = _model(nspin)
+        ham = m.gen_ham_sparse(k).toarray()
+        assert np.allclose(ham, m._gen_ham(k).reshape(ham.shape))
+    m = _model().make_supercell([[4, 0], [0, 3]])
+    ev_all = m.solve_one(k)
+    (eval, evec) = m.solve_window([k], e_center=0.1, n_bands=4, eig_vectors=True)
+    near = np.sort(ev_all[np.argsort(np.abs(ev_all - 0.1))[:4]])
+    assert np.allclose(eval[:, 0], near)
+    ham = m._gen_ham(k)
+    assert np.allclose(ham @ evec[:, 0, :].T, evec[:, 0, :].T * eval[:, 0])
+
+
+def test_set_hops():
+    amps = [0.3 + 0.1j, -0.2, 0.5, 0.1j]
+    ind_i = [0, 1, 0, 2]
+    ind_j = [1, 2, 0, 0]
+    ind_R = [[0, 0], [1, 0], [0, 1], [1, -1]]
+    m = _model()
+    m2 = tb_model(2, 2, m._lat, m._orb)
+    m2.set_onsite([0.1, 0.2, -0.3])
+    m2.set_hops(amps, ind_i, ind_j, ind_R)
+    k = [0.3, 0.2]
+    assert np.allclose(m._gen_ham(k), m2._gen_ham(k))
+    m2.set_hops([1.0, 1.0], [0, 0], [1, 1], [[0, 0], [0, 0]], mode="add")
+    m.set_hop(2.0, 0, 1, [0, 0], mode="add")
+    assert np.allclose(m._gen_ham(k), m2._gen_ham(k))
+    for args in [([0.1], [1], [0], [[0, 0]]), ([0.1], [0], [1], [[0, 0]]), ([0.1], [1], [1], [[0, 0]])]:
+        try:
+            m2.set_hops(*args)
+        except Exception:
+            pass
+        else:
+            assert False
+
+
+def test_make_supercell():
+    m = _model()
+    sc = m.make_supercell([[2, 1], [-1, 2]])
+    assert sc._norb == 5 * m._norb
+    # bands of the super-cell at Gamma are the bands of the primitive
+    # cell at k-points that fold onto Gamma
+    folded = [np.linalg.solve(np.array([[2, 1], [-1, 2]]), g) for g in np.indices((5, 5)).reshape((2, -1)).T]
+    ks = np.unique(np.round(np.array(folded) % 1.0, 8), axis=0)
+    ev = np.sort(np.concatenate([m.solve_one(k) for k in ks]))
+    assert len(ks) == 5
+    assert np.allclose(sc.solve_one([0.0, 0.0]), ev)
+
+
+def test_cut_piece():
+    m = _model()
+    k = [0.2, 0.0]
+    # glued piece of n cells has the bands at k-points folded from k
+    glued = m.cut_piece(4, 1, glue_edgs=True)
+    ev = np.sort(np.concatenate([m.solve_one([k[0], q / 4.0]) for q in range(4)]))
+    assert np.allclose(glued.solve_one([k[0]]), ev)
+    flake = m.cut_piece(3, 1).cut_piece(2, 0)
+    assert flake._dim_k == 0
+    assert flake._norb == 6 * m._norb
+
+
+def _write_w90(path, prefix="test", nw=2):
+    rng = np.random.default_rng(3)
+    with open(path / (prefix + "_geom.dat"), "w") as f:
+        f.write("2.0 0.0 0.0\n0.0 2.0 0.0\n0.0 0.0 3.0\n%d\n" % nw)
+        for v in rng.random((nw, 3)):
+            f.write("%f %f %f\n" % tuple(v))
+    ham = {(0, 0, 0): np.diag(rng.random(nw)) + 0.0j}
+    for R in [(1, 0, 0), (0, 1, 1)]:
+        ham[R] = rng.normal(size=(nw, nw)) + 1.0j * rng.normal(size=(nw, nw))
+        ham[tuple(-x for x in R)] = ham[R].conj().T
+    with open(path / (prefix + "_hr.dat"), "w") as f:
+        f.write("test\n%d\n%d\n" % (nw, len(ham)) + "    1" * len(ham) + "\n")
+        for R, h in ham.items():
+            for j in range(nw):
+                for i in range(nw):
+                    f.write("%d %d %d %d %d %.6f %.6f\n" % (R + (i + 1, j + 1, h[i, j].real, h[i, j].imag)))
+    return ham
+
+
+def test_w90_hr_cache(tmp_path):
+    ham = _write_w90(tmp_path)
+    first = w90(str(tmp_path), "test")
+    assert (tmp_path / "test_hr.dat.npz").exists()
+    second = w90(str(tmp_path), "test")
+    assert isinstance(second.ham_r[(0, 0, 0)]["h"], np.memmap)
+    for w in (first, second):
+        assert sorted(w.ham_r) == sorted(ham)
+        for R in ham:
+            assert np.allclose(w.ham_r[R]["h"], ham[R], atol=1e-6)
+
+
+def test_w90_model(tmp_path):
+    ham = _write_w90(tmp_path)
+    w = w90(str(tmp_path), "test")
+    m = w.model(nspin=1)
+    k = np.array([0.1, 0.3, -0.2])
+    orb = np.array(w.red_cen)
+    ref = sum(
+        h * np.exp(2.0j * np.pi * np.dot(np.array(R)[None, None, :] + orb[None, :, :] - orb[:, None, :], k))
+        for R, h in ham.items()
+    )
+    assert np.allclose(m._gen_ham(k), ref, atol=1e-5)
+    assert len(w.model(nspin=1, max_distance=2.5)._hoppings) < len(m._hoppings)
+
+
+def test_w90_memmap_storage(tmp_path, monkeypatch):
+    _write_w90(tmp_path, nw=3)
+    ref = w90(str(tmp_path), "test", use_cache=False)
+    w = w90(str(tmp_path), "test", use_cache=False, storage="memmap")
+    assert isinstance(w._hr_ham, np.memmap)
+    # one R-block per chunk
+    monkeypatch.setattr(pythtb_respack, "W90_MEMORY_BUDGET", 1)
+    k = [0.2, 0.1, 0.4]
+    assert np.allclose(w.model(nspin=1)._gen_ham(k), ref.model(nspin=1)._gen_ham(k))
+    assert np.allclose(w.dist_hop()[1], ref.dist_hop()[1])
+
+
+def test_w90_diagnostics(tmp_path):
+    ham = _write_w90(tmp_path, nw=2)
+    w = w90(str(tmp_path), "test", use_cache=False)
+    (dist, hops) = w.dist_hop()
+    # all terms except the onsite ones
+    assert len(dist) == len(hops) == len(ham) * 4 - 2
+    assert np.all(np.diff(w.shells()) > 0)
+    # shells include also the onsite distance
+    assert np.allclose(w.shells(1), np.unique(np.round(np.append(dist, 0.0), 1)))
+
+
+def test_solve_on_grid():
+    m = _model()
+    wf = wf_array(m, [5, 4])
+    gaps = wf.solve_on_grid([-0.5, 0.0])
+    all_gaps = []
+    for i in range(4):
+        for j in range(3):
+            (eval, evec) = m.solve_one([-0.5 + i / 4.0, j / 3.0], eig_vectors=True)
+            assert np.allclose(wf[i, j], evec)
+            all_gaps.append(eval[1:] - eval[:-1])
+    assert np.allclose(gaps, np.min(all_gaps, axis=0))
+
+
+def test_one_berry_loop():
+    m = _model()
+    ks = [[q, 0.3] for q in np.linspace(0.0, 1.0, 21)]
+    (eval, evec) = m.solve_all(ks, eig_vectors=True)
+    # states at k and k+G differ by phases of orbital positions
+    evec[:, -1, :] = evec[:, 0, :] * np.exp(-2.0j * np.pi * m._orb[:, 0])[None, :]
+    wf = np.swapaxes(evec[:2], 0, 1)
+    pha = pythtb_respack._one_berry_loop(wf)
+    pha_ev = pythtb_respack._one_berry_loop(wf, berry_evals=True)
+    # reference with explicit product of overlap matrices
+    prd = np.identity(2, dtype=complex)
+    for i in range(len(ks) - 1):
+        prd = prd @ (wf[i].conj() @ wf[i + 1].T)
+    assert np.isclose(np.exp(-1.0j * pha), np.exp(1.0j * np.angle(np.linalg.det(prd))))
+    assert np.isclose(np.exp(1.0j * pha), np.exp(1.0j * np.sum(pha_ev)))
+
+
+def test_berry_flux():
+    rng = np.random.default_rng(0)
+    wfs = rng.normal(size=(3, 5, 4, 2, 3)) + 1.0j * rng.normal(size=(3, 5, 4, 2, 3))
+    flux = pythtb_respack._flux_planes(wfs, nlead=1)
+    assert flux.shape == (3, 4, 3)
+    # reference with Berry phase around each plaquette
+    for n in range(3):
+        for i in range(4):
+            for j in range(3):
+                loop = wfs[n, [i, i + 1, i + 1, i, i], [j, j, j + 1, j + 1, j]]
+                pha = pythtb_respack._one_berry_loop(loop)
+                assert np.isclose(np.exp(1.0j * flux[n, i, j]), np.exp(1.0j * pha))
+    # slices of 3D grid agree with 2D planes
+    m = pythtb_respack.tb_model(3, 3, np.eye(3), [[0.0] * 3, [0.5, 0.2, 0.1]])
+    m.set_onsite([0.2, -0.2])
+    for d, amp in enumerate([0.3, 0.2j, 0.1]):
+        R = [0, 0, 0]
+        R[d] = 1
+        m.set_hop(amp, 0, 1, R)
+    wf = wf_array(m, [4, 5, 3])
+    wf.solve_on_grid([0.0, 0.0, 0.0])
+    flux = wf.berry_flux([0], dirs=[2, 0], individual_phases=True)
+    assert flux.shape == (5, 2, 3)
+    for i in range(5):
+        plane = np.swapaxes(wf._wfs[:, i, :, :1], 0, 1)
+        assert np.allclose(flux[i], pythtb_respack._one_flux_plane(plane))
+
+
+def test_wf_array_memmap(tmp_path, monkeypatch):
+    m = _model()
+    wf = wf_array(m, [5, 4])
+    wf.solve_on_grid([0.0, 0.0])
+    # read and write wavefunctions in the smallest possible chunks
+    monkeypatch.setattr(pythtb_respack, "WF_MEMORY_BUDGET", 1)
+    fname = str(tmp_path / "grid.npy")
+    wf_map = wf_array(m, [5, 4], storage="memmap", filename=fname)
+    assert isinstance(wf_map._wfs, np.memmap)
+    wf_map.solve_on_grid([0.0, 0.0])
+    assert np.allclose(wf_map._wfs, wf._wfs)
+    assert np.allclose(
+        wf_map.berry_flux([0, 1], individual_phases=True),
+        wf.berry_flux([0, 1], individual_phases=True),
+    )
+    assert np.allclose(wf_map.berry_phase([0, 1], dir=1), wf.berry_phase([0, 1], dir=1))
+    # reopen solved grid without solving again
+    wf_again = wf_array(m, [5, 4], storage="memmap", filename=fname)
+    assert np.allclose(wf_again[2, 1], wf[2, 1])
+    assert np.isclose(wf_again.berry_flux([0, 1]), wf.berry_flux([0, 1]))
+    with pytest.raises(Exception):
+        wf_array(m, [4, 4], storage="memmap", filename=fname)
+    # unnamed temporary file
+    wf_tmp = wf_array(m, [5, 4], storage="memmap")
+    wf_tmp.solve_on_grid([0.0, 0.0])
+    assert np.allclose(wf_tmp._wfs, wf._wfs)
+
+
+def test_phases_cont():
+    assert np.isclose(pythtb_respack.no_2pi(0.1 + 4.0 * np.pi, -0.2), 0.1)
+    assert np.isclose(pythtb_respack.no_2pi(-3.0, 3.0), -3.0 + 2.0 * np.pi)
+    # winding bands that never meet on the unit circle
+    t = np.linspace(0.0, 1.0, 31)
+    bands = np.array([0.3, 2.4, -2.0])[None, :] + 2.0 * np.pi * t[:, None]
+    bands[:, 2] += 0.5 * t
+    pha = pythtb_respack._one_phase_cont(np.angle(np.exp(1.0j * bands[:, 0])), 0.0)
+    assert np.allclose(pha, bands[:, 0])
+    # shuffle and wrap phases in each row
+    rng = np.random.default_rng(1)
+    order = np.argsort(rng.random(bands.shape), axis=1)
+    wrapped = np.angle(np.exp(1.0j * np.take_along_axis(bands, order, axis=1)))
+    pha = pythtb_respack._array_phases_cont(wrapped, bands[0])
+    assert np.allclose(pha, bands)
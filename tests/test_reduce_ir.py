@@ -1,4 +1,62 @@
 import importlib
+import numpy as np
+from pointgroup import GetCharacter, GetIR, TBModel, tb_model
 
 def test_import():
     importlib.import_module('pointgroup.reduce_ir')
+
+
+def test_reduce_all():
+    lat=[[1.0,0.0,0.0],[0.0,1.0,0.0],[0.0,0.0,1.0]]
+    orb=[[0.0,0.0,0.0]]
+    my_model=tb_model(3,3,lat,orb)
+    my_model.set_onsite([0])
+    my_model.set_hop(0.6, 0, 0, [1, 0, 0])
+    my_model.set_hop(0.6, 0, 0, [0, 1, 0])
+    my_model.set_hop(0.6, 0, 0, [0, 0, 1])
+    tb = TBModel(pythtb_obj=my_model, site_species=[1])
+    tb.gen_pythtb()
+
+    gcclass = GetCharacter(tb)
+    chars = gcclass.get_character_tensor()
+    ir = GetIR(gcclass)
+    w = ir.reduce_all(chars)
+    nir = ir._get_ir()
+    assert w.shape == chars.shape[:-1] + (nir,)
+    for i in range(nir):
+        assert np.allclose(w[0, 0, i], ir.reduce_ir(chars[0, 0], ir_idx=i))
+
+
+def _reduce_ir_model(lat, orb, species):
+    my_model = tb_model(3, 3, lat, orb)
+    my_model.set_onsite([0.0] * len(orb))
+    my_model.set_hop(0.3, 0, 0, [1, 0, 0])
+    tb = TBModel(pythtb_obj=my_model, site_species=species)
+    tb.gen_pythtb()
+    return GetCharacter(tb)
+
+
+def test_reduce_ir_d2h():
+    # 文字列のクラス名では対応しない操作がある点群
+    gcclass = _reduce_ir_model(np.diag([1.0, 1.25, 1.5]), [[0.0, 0.0, 0.0]], [1])
+    chars = gcclass.get_character_tensor()
+    ir = GetIR(gcclass)
+    assert ir.pg == "D2h"
+    w = ir.reduce_all(chars)
+    for i in range(ir._get_ir()):
+        assert np.allclose(w[:, :, i], ir.reduce_ir(chars, ir_idx=i))
+
+
+def test_reduce_ir_d2d():
+    lat = np.diag([1.0, 1.0, 1.5])
+    orb = [[0.0, 0.0, 0.0], [0.5, 0.0, 0.25], [0.0, 0.5, 0.75]]
+    gcclass = _reduce_ir_model(lat, orb, [1, 2, 2])
+    chars = gcclass.get_character_tensor()
+    ir = GetIR(gcclass)
+    assert ir.pg == "D2d"
+    assert np.all(ir._get_op_class_idx() >= 0)
+    w = ir.reduce_all(chars)
+    for i in range(ir._get_ir()):
+        assert np.allclose(w[:, :, i], ir.reduce_ir(chars, ir_idx=i))
+    # 恒等表現の指標は全て1
+    assert np.allclose(ir.reduce_all(np.ones(chars.shape[-1]))[0], 1.0)
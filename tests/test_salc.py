@@ -2,3 +2,20 @@ import importlib
 
 def test_import():
     importlib.import_module('pointgroup.salc')
+
+
+def test_make_salc_site_d2d():
+    import numpy as np
+    from pointgroup import GetCharacter, TBModel, tb_model
+    from pointgroup.salc import GetSALC
+    lat = np.diag([1.0, 1.0, 1.5])
+    orb = [[0.0, 0.0, 0.0], [0.5, 0.0, 0.25], [0.0, 0.5, 0.75]]
+    my_model = tb_model(3, 3, lat, orb)
+    my_model.set_onsite([0.0, 0.0, 0.0])
+    tb = TBModel(pythtb_obj=my_model, site_species=[1, 2, 2])
+    tb.gen_pythtb()
+    salc = GetSALC(GetCharacter(tb))
+    assert salc.pg == "D2d"
+    # 文字列のクラス名では対応しない操作を含む点群でも恒等表現の重みが求まる
+    w = salc.make_salc_site(sym_idx=0)
+    assert np.allclose(list(w.values()), [8.0, 4.0, 4.0])
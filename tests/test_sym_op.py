@@ -2,3 +2,16 @@ import importlib
 
 def test_import():
     importlib.import_module('pointgroup.sym_op')
+
+
+def test_site_permutation():
+    import numpy as np
+    from pointgroup.symmetry import get_symmetry_context
+    lat = [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 10.0]]
+    pos = np.array([[0.0, 0.0, 0.0], [0.5, 0.5, 0.0]])
+    ctx = get_symmetry_context(lat, pos, [1, 1])
+    sp = ctx.site_permutation()
+    assert sp.perm.shape == (ctx.nsymm_ops, 2)
+    assert np.all(np.sort(sp.perm, axis=1) == [0, 1])
+    new_pos = np.einsum("gab,jb->gja", ctx.rot, pos) + ctx.trans[:, None, :]
+    assert np.allclose(new_pos, pos[sp.perm] + sp.G)
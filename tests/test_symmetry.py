@@ -0,0 +1,42 @@
+import importlib
+from pointgroup.symmetry import get_symmetry_context, clear_symmetry_cache
+
+def test_import():
+    importlib.import_module('pointgroup.symmetry')
+
+
+def test_cache():
+    clear_symmetry_cache()
+    lat = [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]]
+    orb = [[0.0, 0.0, 0.0]]
+    ctx1 = get_symmetry_context(lat, orb, [1])
+    ctx2 = get_symmetry_context(lat, orb, [1])
+    assert ctx1 is ctx2
+    assert ctx1.nsymm_ops == 48
+    assert ctx1.pg == "m-3m"
+    ctx3 = get_symmetry_context(lat, orb, [1], symprec=1e-3)
+    assert ctx3 is not ctx1
+
+
+def test_little_group():
+    lat = [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]]
+    ctx = get_symmetry_context(lat, [[0.0, 0.0, 0.0]], [1])
+    assert ctx.little_group([0.0, 0.0, 0.0]).pg_schonflies == "Oh"
+    assert ctx.little_group([0.5, 0.5, 0.5]).order == 48
+    lg = ctx.little_group([0.5, 0.0, 0.0])
+    assert lg.pg_schonflies == "D4h"
+    assert lg is ctx.little_group([-0.5, 0.0, 0.0])
+    assert ctx.little_group([0.1, 0.2, 0.3]).pg_schonflies == "C1"
+
+
+def test_op_classes_hexagonal():
+    import numpy as np
+    lat = [[1.0, 0.0, 0.0], [-0.5, np.sqrt(3.0) / 2.0, 0.0], [0.0, 0.0, 1.6]]
+    ctx = get_symmetry_context(lat, [[0.0, 0.0, 0.0]], [1])
+    assert ctx.pg == "6/mmm"
+    # 整数に切り捨てると六方晶の回転行列が壊れて分類できない
+    assert ctx.rot_o3.dtype == float
+    names = [op_name for op_name, _ in ctx.op_classes]
+    assert len(names) == ctx.nsymm_ops
+    for name, count in [("E", 1), ("C6(z)", 2), ("C3(z)", 2), ("C2(z)", 1), ("i", 1)]:
+        assert names.count(name) == count